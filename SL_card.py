@@ -3,33 +3,44 @@ import numpy as np
 import json
 import joblib
 from tqdm import tqdm
-from pdkutils import visual_cards, CARD_RANK_STR, CARD_TYPE, CARD_RANK_STR_INDEX, TYPE_CARD
+from pdkutils import visual_cards, CARD_RANK_STR, CARD_TYPE, CARD_RANK_STR_INDEX, TYPE_CARD, sort_card, encode_planes
+from dataset import ShardedDatasetWriter
 from collections import OrderedDict
 
 DATA_PATH = '/Users/fanglinjiajie/locals/datasets/CardData/'
 ORDER = '3456789TJQKA2'
-CLASSES = list(TYPE_CARD.keys())
+# rows of the csv files read at a time
+CHUNK_SIZE = 1 << 18
 
-DATA = pd.read_csv(DATA_PATH + 'clean_pdk.csv', dtype=str).fillna('')
+
+def read_csv_chunks(file, chunksize=CHUNK_SIZE, usecols=None):
+    return pd.read_csv(DATA_PATH + file, dtype=str, chunksize=chunksize, usecols=usecols)
 
 
 # ======================== Data processing ========================
 # data cleaning
 
-def clean_data():
+def clean_data(chunksize=CHUNK_SIZE):
     # only consider three-people game
     with open(DATA_PATH + 'three.csv', 'r') as file:
-        three_game = json.load(file)
-    data = pd.read_csv(DATA_PATH + 'paodekuai.csv', dtype=str).fillna('')
-    data['table_turn_id'] = data['tableid'] + '_' + data['turn']
-    data = data[['table_turn_id', 'userid', 'play', 'remains']]
-    data['play'] = data['play'].apply(numbers2cards)
-    data['remains'] = data['remains'].apply(numbers2cards)
-    data = data[data['table_turn_id'].isin(three_game)]
-    data.to_csv(DATA_PATH + 'clean_pdk.csv', index=False)
-
-
-def data_play_record():
+        three_game = set(json.load(file))
+    header = True
+    for data in tqdm(read_csv_chunks('paodekuai.csv', chunksize), unit='chunk'):
+        data = data.fillna('')
+        data['table_turn_id'] = data['tableid'] + '_' + data['turn']
+        data = data.loc[data['table_turn_id'].isin(three_game), ['table_turn_id', 'userid', 'play', 'remains']]
+        data['play'] = numbers2cards_series(data['play'])
+        data['remains'] = numbers2cards_series(data['remains'])
+        data.to_csv(DATA_PATH + 'clean_pdk.csv', index=False, mode='w' if header else 'a', header=header)
+        header = False
+
+
+def play_records(chunksize=CHUNK_SIZE):
+    """
+    Replay the games of clean_pdk.csv, whose rows are grouped by table_turn_id, chunk by chunk
+    :return: generator of (userid, obs, action) of the non-pass actions of the winners,
+        obs = [current_hand, others_hand, the last 3 plays, played_cards]
+    """
     # select winners
     with open(DATA_PATH + 'winner.csv', 'r') as file:
         game_winner = json.load(file)
@@ -42,134 +53,93 @@ def data_play_record():
     # rank_player = rank_player.loc[:200, :]
     # rank_player = list(rank_player[rank_player['累计赢率'] > '0.4']['用户'])
 
-    # read game data
-    data = DATA.copy()
-    data_play = OrderedDict()
     game_idx = None
-
-    for i in tqdm(data.index):
-
-        # New game, reset memories
-        if game_idx != data['table_turn_id'][i]:
-            game_idx = data['table_turn_id'][i]
-            memory_play = [''] * 3
-            memory_hands = {}
-            played_cards = ''
-
-
-        usr_id = data['userid'][i]
-        remains = data['remains'][i]
-        action = data['play'][i]
-
-        #
-        if usr_id in memory_hands:
-            memory_hands.pop(usr_id)
-
-        # Record only pro player
-        # if usr_id in rank_player:
-
-        # Select winning games
-        if winners[game_idx] == usr_id:
-
-            if usr_id not in data_play:
-                data_play[usr_id] = []
-
-            # if action is not pass, record the [obs,action] pair
-            if action:
-                others_hand = ''
-                for cards in memory_hands.values():
-                    others_hand += cards
-
+    usecols = ['table_turn_id', 'userid', 'play', 'remains']
+    for data in tqdm(read_csv_chunks('clean_pdk.csv', chunksize, usecols), unit='chunk'):
+        data = data.fillna('')
+        for table_turn_id, usr_id, action, remains in zip(data['table_turn_id'], data['userid'],
+                                                          data['play'], data['remains']):
+
+            # New game, reset memories
+            if game_idx != table_turn_id:
+                game_idx = table_turn_id
+                memory_play = [''] * 3
+                memory_hands = {}
+                played_cards = ''
+                winner = winners[game_idx]
+
+            #
+            if usr_id in memory_hands:
+                memory_hands.pop(usr_id)
+
+            # Record only pro player
+            # if usr_id in rank_player:
+
+            # Select winning games, if action is not pass, record the [obs,action] pair
+            if winner == usr_id and action:
                 current_hand = sort_card(remains + action)
-                others_hand = sort_card(others_hand)
+                others_hand = sort_card(''.join(memory_hands.values()))
                 obs = [current_hand, others_hand] + memory_play + [played_cards]
-                data_play[usr_id] += [[obs, action]]
-
                 # check data
                 if set(current_hand + others_hand + played_cards) != set(
                         '3333444455556666777788889999TTTTJJJJQQQQKKKKAAA2'):
                     print(usr_id)
                     raise ValueError('Cards are not coincident')
+                yield usr_id, obs, action
 
-        # update memories, left is new, right is old
-        memory_play.pop()
-        memory_play = [action] + memory_play
-        memory_hands[usr_id] = remains
-        played_cards += action
-
-    with open(DATA_PATH + 'data_play_record_win.csv', 'w') as file:
-        json.dump(data_play, file)
+            # update memories, left is new, right is old
+            memory_play = [action] + memory_play[:2]
+            memory_hands[usr_id] = remains
+            played_cards += action
 
 
-def sl_data_str_tensor():
-    with open(DATA_PATH + 'data_play_record_win.csv', 'r') as file:
-        data = json.load(file)
+def data_play_record():
+    data_play = OrderedDict()
+    for usr_id, obs, action in play_records():
+        data_play.setdefault(usr_id, []).append([obs, action])
 
-    behaviors = []
-    # each record correspoonds to one player
-    for record in data.values():
-        behaviors += record
+    with open(DATA_PATH + 'data_play_record_win.csv', 'w') as file:
+        json.dump(data_play, file)
 
-    data_x = []
-    data_y = []
-    for state, action in tqdm(behaviors):
-        state_tensor = []
-        for obs in state:
-            state_tensor.append(cards_encode_tensor(obs))
-        data_x.append(np.array(state_tensor))
-        data_y.append(cards_encode_tensor(action))
 
-    np.save(DATA_PATH + 'card_tensor_data_x_win', np.array(data_x))
-    np.save(DATA_PATH + 'card_tensor_data_y_win', np.array(data_y))
+def sl_data_str_tensor(chunk_size=1 << 16, new=True):
+    """
+    Encode the records of play_records into the sharded dataset card_tensor_data_win, see dataset.py
+    """
+    planes = np.zeros((7, 4, 13), dtype=np.uint8)
+    with ShardedDatasetWriter(DATA_PATH + 'card_tensor_data_win', chunk_size=chunk_size, new=new) as writer:
+        for _, obs, action in play_records():
+            # the 6 planes of the state and the plane of the action at once
+            encode_planes(planes, obs + [action])
+            writer.append(planes[:6], planes[6])
 
 # ============================== utils functions ==============================
 
 
-def sort_card(cards):
-    """
-    i.e. '43592TAK' -> return '3459TKA2'
-    :param cards: (str) of cards
-    :return:
-    """
-    order = '3456789TJQKA2'
-    res = ''
-    candid = list(cards)
-    for card in order:
-        while card in candid:
-            res += card
-            candid.remove(card)
+def type_one_hot(card_type):
+    classes = list(TYPE_CARD.keys())
+    res = np.zeros(len(classes))
+    res[classes.index(card_type)] = 1
     return res
 
 
-def type_one_hot(card_type):
-    res = np.zeros(len(CLASSES))
-    res[CLASSES.index(card_type)] = 1
-    return res
+# numbers in data to cards, e.g. '310' -> 'T', the numbers which are not listed are their last digit
+NUMBER_CARDS = {'10': 'T', '11': 'J', '12': 'Q', '13': 'K', '14': 'A', '16': '2'}
 
 
-# numbers in data to cards
 def numbers2cards(numbers):
     res = ''
     if numbers:
-        numbers = numbers.split(sep=',')
-        for number in numbers:
-            if number[1:] == '10':
-                res += 'T'
-            elif number[1:] == '11':
-                res += 'J'
-            elif number[1:] == '12':
-                res += 'Q'
-            elif number[1:] == '13':
-                res += 'K'
-            elif number[1:] == '14':
-                res += 'A'
-            elif number[1:] == '16':
-                res += '2'
-            else:
-                res += number[-1]
+        res = ''.join([NUMBER_CARDS.get(number[1:]) or number[-1] for number in numbers.split(sep=',')])
     return sort_card(res)
 
 
+def numbers2cards_series(numbers):
+    # the columns repeat the same plays and hands, decode each distinct one once
+    uniques = numbers.unique()
+    return numbers.map(dict(zip(uniques, map(numbers2cards, uniques))))
+
+
 # cards to 4*13 matrix
 def cards_encode_tensor(cards):
     plane = np.zeros((4, 13))
@@ -3,11 +3,10 @@ import torch
 from torch import nn
 import bottleneck
 from Deepcard import DeepCard, loss_function
-from pdkutils import gt_greater_cards_from_hands, classify_actions, hands_islands
+from pdkutils import gt_greater_cards_from_hands, classify_actions, hands_islands, CARD_TABLES
 from pdkjudger import PaodekuaiJudger
 
 import joblib
-from SL_card import cards_encode_tensor
 
 DATA_PATH = '/Users/fanglinjiajie/locals/datasets/CardData/'
 
@@ -16,21 +15,65 @@ DATA_PATH = '/Users/fanglinjiajie/locals/datasets/CardData/'
 #
 
 
+def action_losses(prediction, tensor_cards):
+    ''' The loss of every action against the prediction, in one call of loss_function
+
+    loss_function is elementwise, so its unreduced loss over the stacked planes
+    averaged over the planes of an action orders the actions as calling it on
+    every action alone: all the actions have 52 elements.
+
+    Args:
+        prediction (torch.Tensor): the prediction of the model, of shape (1, 1, 4, 13)
+        tensor_cards (torch.Tensor): the planes of the actions, of shape (K, 1, 4, 13)
+
+    Returns:
+        (torch.Tensor): the K losses
+    '''
+    try:
+        losses = loss_function(prediction.expand_as(tensor_cards), tensor_cards, reduction='none')
+    except TypeError:
+        # a loss_function without a reduction argument, one call per action
+        return torch.stack([torch.as_tensor(loss_function(prediction, tensor_card[None]))
+                            for tensor_card in tensor_cards])
+    return losses.reshape(len(tensor_cards), -1).mean(dim=1)
+
+
 class SL_Agent(object):
     ''' A model based agent.
     '''
 
-    def __init__(self, model_file, generate_data=False, entropy=False):
+    def __init__(self, model_file, generate_data=False, entropy=False, inference=None):
         ''' Initilize the agent
 
         Args:
             action_num (int): The size of the ouput action space
+            inference (object): an InferenceServer or InferenceClient which runs
+                the model for the agent in batches with other games, see inference.py
         '''
         self.use_raw = True
         self.generate_data = generate_data
         self.entropy = entropy
+        self.inference = inference
         self.model = DeepCard()
         self.model.load_state_dict(torch.load(DATA_PATH + model_file, map_location=torch.device('cpu')))
+        # planes of the legal actions, reused by the steps and grown when needed
+        self._action_planes = np.zeros((64, 1, 4, 13), dtype=np.float32)
+
+    def encode_actions(self, legal_actions):
+        ''' Gather the planes of the legal actions into one tensor, see CardTables.planes
+
+        Args:
+            legal_actions (list): list of str of actions, without 'pass'
+
+        Returns:
+            (torch.Tensor): the planes of shape (K, 1, 4, 13), a view of a buffer of the agent
+        '''
+        num = len(legal_actions)
+        if num > len(self._action_planes):
+            self._action_planes = np.zeros((2 * num, 1, 4, 13), dtype=np.float32)
+        planes = self._action_planes[:num]
+        CARD_TABLES.encode_planes(legal_actions, out=planes.reshape(num, 4, 13))
+        return torch.from_numpy(planes)
 
     def step(self, state):
         ''' Predict the action given the curent state in gerenerating training data.
@@ -63,15 +106,20 @@ class SL_Agent(object):
 
         # set the model to evaluation mode, otherwise the output would be wrong
         with torch.no_grad():
-            self.model.eval()
-            obs = torch.FloatTensor(state['obs']).reshape(-1, 6, 4, 13)
-            prediction = self.model(obs).view(-1, 1, 4, 13)
+            if self.inference is not None:
+                prediction = torch.from_numpy(self.inference.predict(state['obs'])).view(-1, 1, 4, 13)
+            else:
+                self.model.eval()
+                obs = torch.FloatTensor(state['obs']).reshape(-1, 6, 4, 13)
+                prediction = self.model(obs).view(-1, 1, 4, 13)
+
+            # score all the legal actions at once
+            tensor_cards = self.encode_actions(legal_actions)
 
             if self.generate_data:
                 # return choices by prob
                 softmax = nn.Softmax(dim=0)
-                tensor_cards = torch.FloatTensor([cards_encode_tensor(cards) for cards in legal_actions]).view(-1, 1, 4, 13)
-                inner_product = torch.FloatTensor([(prediction * cards).sum() for cards in tensor_cards])
+                inner_product = (prediction * tensor_cards).sum(dim=(1, 2, 3))
                 #
                 similarity = softmax(inner_product).numpy()
                 top_cards_idx = bottleneck.argpartition(-similarity, 1)[:2]
@@ -82,27 +130,11 @@ class SL_Agent(object):
             elif not self.entropy:
                 # SL card： select the nearest card to the predicted tensor
                 # use similarity = inner product
-                choice = ''
-                similarity = -1
-                for cards in legal_actions:
-                    tensor_card = torch.FloatTensor(cards_encode_tensor(cards)).reshape(-1, 1, 4, 13)
-                    new_sim = (prediction * tensor_card).sum()
-                    if new_sim > similarity:
-                        choice = cards
-                        similarity = new_sim
-                return choice
+                similarity = (prediction * tensor_cards).sum(dim=(1, 2, 3))
+                return legal_actions[int(similarity.argmax())]
             else:
-                choice = ''
-                loss = 100000
-                for cards in legal_actions:
-                    tensor_card = torch.FloatTensor(cards_encode_tensor(cards)).reshape(-1, 1, 4, 13)
-                    new_loss = loss_function(prediction, tensor_card)
-                    if new_loss < loss:
-                        choice = cards
-                        loss = new_loss
-                return choice
-
-
+                losses = action_losses(prediction, tensor_cards)
+                return legal_actions[int(losses.argmin())]
 
     def eval_step(self, state):
         ''' Predict the action given the current state for evaluation.
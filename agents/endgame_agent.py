@@ -0,0 +1,84 @@
+from pdksolver import EndgameSolver, SolverBudgetExceeded, position_from_trace
+
+
+class EndgameAgent(object):
+    ''' Play an agent, and switch to the exact endgame solver when few cards remain
+
+    The solver needs all the hands, so the agent reads the perfect information
+    of env. The moves of the wrapped agent are kept when the solver runs out
+    of budget or finds no forced win. The env passes the actions of the solver,
+    which are raw, as they are to the game.
+    '''
+
+    def __init__(self, agent, env, threshold=12, max_nodes=200000, time_limit=None, max_entries=1000000):
+        ''' Initilize the agent
+
+        Args:
+            agent (object): the agent to play until the endgame
+            env (Env): the env of the games, see Env.get_perfect_information
+            threshold (int): solve when fewer cards than threshold remain in all the hands
+            max_nodes (int): the most nodes of a solve
+            time_limit (float): the most seconds of a solve
+            max_entries (int): the most entries kept in the tables of the solver between solves
+        '''
+        self.agent = agent
+        self.env = env
+        self.use_raw = agent.use_raw
+        self.threshold = threshold
+        self.solver = EndgameSolver(max_nodes=max_nodes, time_limit=time_limit, max_entries=max_entries)
+        # moves taken from the solver, and the solves which ran out of budget
+        self.solved = 0
+        self.exceeded = 0
+
+    def solve(self, state):
+        ''' Search a forced win of the player to act
+
+        Returns:
+            action (str): the winning action, or None
+        '''
+        information = self.env.get_perfect_information()
+        hands = information['hand_cards']
+        if sum(len(hand) for hand in hands) >= self.threshold:
+            return None
+        if len(information['legal_actions']) == 1:
+            return None
+        current_player = information['current_player']
+        leader, target = position_from_trace(information['trace'], current_player)
+        try:
+            won, action = self.solver.solve(hands, current_player, current_player, leader, target)
+        except SolverBudgetExceeded:
+            self.exceeded += 1
+            return None
+        if won:
+            self.solved += 1
+            return action
+        return None
+
+    def step(self, state):
+        ''' Predict the action given the curent state in gerenerating training data.
+
+        Args:
+            state (dict): An dictionary that represents the current state
+
+        Returns:
+            action: The winning action of the solver, or the action of the agent
+        '''
+        action = self.solve(state)
+        if action is not None:
+            return action
+        return self.agent.step(state)
+
+    def eval_step(self, state):
+        ''' Predict the action given the current state for evaluation.
+
+        Args:
+            state (dict): An dictionary that represents the current state
+
+        Returns:
+            action: The winning action of the solver, or the action of the agent
+            probs: The probabilities of the agent, None for the solver
+        '''
+        action = self.solve(state)
+        if action is not None:
+            return action, None
+        return self.agent.eval_step(state)
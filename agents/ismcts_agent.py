@@ -0,0 +1,375 @@
+import math
+import time
+import random
+import weakref
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from pdkutils import sort_card
+from pdkmovegen import MOVE_CACHE, gt_cards_from_hand, str2code, code2str
+
+
+class Simulator(object):
+    ''' A light copy of the game for the simulations, on rank strings only
+
+    It follows the rules of PaodekuaiGame: the player who played the greatest
+    cards, or a player whose cards no one beat, plays any playable cards, the
+    others have to beat target or pass if they can not.
+    '''
+    __slots__ = ('hands', 'codes', 'current', 'greater', 'target', 'winner')
+
+    def __init__(self, hands, current, greater, target):
+        ''' Initialize the simulator
+
+        Args:
+            hands (list): the sorted hand of every player, e.g. ['3445', ...]
+            current (int): the player to act
+            greater (int): the player who played target, or None
+            target (str): the cards to beat, or None
+        '''
+        self.hands = list(hands)
+        self.codes = [str2code(hand) for hand in hands]
+        self.current = current
+        self.greater = greater
+        self.target = target
+        self.winner = None
+
+    def legal_actions(self):
+        ''' Get the legal actions of the current player
+
+        Returns:
+            list: list of string of actions
+        '''
+        hand = self.hands[self.current]
+        if self.greater is None or self.greater == self.current:
+            return list(MOVE_CACHE.playable_moves(hand))
+        return gt_cards_from_hand(hand, self.target)
+
+    def step(self, action):
+        ''' Play action for the current player
+        '''
+        player = self.current
+        if action != 'pass':
+            code = self.codes[player] - str2code(action)
+            self.codes[player] = code
+            self.hands[player] = code2str(code)
+            self.greater = player
+            self.target = action
+            if not code:
+                self.winner = player
+        self.current = (player + 1) % len(self.hands)
+
+
+def random_rollout_policy(simulator, legal_actions, rng):
+    ''' Finish the game if possible, or play a random legal action
+    '''
+    hand = simulator.hands[simulator.current]
+    if hand in legal_actions:
+        return hand
+    return legal_actions[rng.randrange(len(legal_actions))]
+
+
+class Determinizer(object):
+    ''' Sample the hands of the opponents from the view of a player
+
+    The hidden cards are split at random with the sizes of the remain_*
+    counters. A player only passes when none of his cards beats the target,
+    so the samples in which an opponent could have beaten cards he passed
+    on are rejected.
+    '''
+
+    def __init__(self, raw_state, max_tries=50):
+        ''' Read the public information of raw_state
+
+        Args:
+            raw_state (dict): state['raw_obs'] of the agent
+            max_tries (int): samples drawn before accepting an inconsistent one
+        '''
+        self.player_id = raw_state['self']
+        self.current_hand = raw_state['current_hand']
+        self.others_hand = raw_state['others_hand']
+        self.max_tries = max_tries
+        num_players = len([key for key in raw_state if key.startswith('remain_')])
+        self.num_players = num_players
+        self.opponents = [(self.player_id + offset) % num_players for offset in range(1, num_players)]
+        self.sizes = [raw_state['remain_{}'.format(player_id)] for player_id in self.opponents]
+
+        trace = raw_state['trace']
+        greater, target = None, None
+        # (target, index of the pass) of every pass of the opponents against a target
+        passes = {player_id: [] for player_id in self.opponents}
+        for index, (player_id, action) in enumerate(trace):
+            if action == 'pass':
+                if player_id in passes and greater is not None and greater != player_id:
+                    passes[player_id].append((target, index))
+            else:
+                greater, target = player_id, action
+        self.greater = greater
+        self.target = target
+        # the hand of a player at a pass is his hand now plus the cards he played since
+        self.constraints = {}
+        for player_id, player_passes in passes.items():
+            constraints = []
+            for target, index in player_passes:
+                played = ''.join([action for _id, action in trace[index + 1:]
+                                  if _id == player_id and action != 'pass'])
+                constraints.append((target, played))
+            self.constraints[player_id] = constraints
+
+    def consistent(self, player_id, hand):
+        ''' Whether hand is consistent with the passes of player_id
+        '''
+        for target, played in self.constraints[player_id]:
+            if gt_cards_from_hand(sort_card(hand + played, cache=True), target) != ['pass']:
+                return False
+        return True
+
+    def sample(self, rng):
+        ''' Sample the hands of all the players
+
+        Args:
+            rng (random.Random): the random generator
+
+        Returns:
+            list: the sorted hand of every player
+        '''
+        cards = list(self.others_hand)
+        for _ in range(self.max_tries):
+            rng.shuffle(cards)
+            hands = [None] * self.num_players
+            hands[self.player_id] = self.current_hand
+            start = 0
+            for player_id, size in zip(self.opponents, self.sizes):
+                # few cards are unknown late in a game, so the same hands come back often
+                hands[player_id] = sort_card(cards[start:start + size], cache=True)
+                start += size
+            if all(self.consistent(player_id, hands[player_id]) for player_id in self.opponents):
+                break
+        return hands
+
+    def simulator(self, rng):
+        ''' Sample a simulator of the game from the view of the player
+        '''
+        return Simulator(self.sample(rng), self.player_id, self.greater, self.target)
+
+
+class Node(object):
+    ''' A node of the information set tree
+    '''
+    __slots__ = ('parent', 'action', 'player', 'children', 'visits', 'wins', 'avails')
+
+    def __init__(self, parent=None, action=None, player=None):
+        self.parent = parent
+        self.action = action
+        # the player who played action to reach the node
+        self.player = player
+        self.children = {}
+        self.visits = 0
+        self.wins = 0
+        self.avails = 1
+
+    def select(self, legal_actions, exploration):
+        ''' UCB1 over the children available in the determinization
+        '''
+        best, best_score = None, -1
+        for action in legal_actions:
+            child = self.children[action]
+            score = child.wins / child.visits + exploration * math.sqrt(math.log(child.avails) / child.visits)
+            if score > best_score:
+                best, best_score = child, score
+        return best
+
+
+def search(raw_state, iterations=None, time_limit=None, exploration=0.7, seed=None,
+           rollout_policy=random_rollout_policy):
+    ''' Run single-observer ISMCTS from raw_state
+
+    Args:
+        raw_state (dict): state['raw_obs'] of the player to act
+        iterations (int): the most simulations to run
+        time_limit (float): the most seconds to run
+        exploration (float): the exploration constant of UCB1
+        seed (int): the seed of the simulations
+        rollout_policy (callable): (simulator, legal_actions, rng) -> action
+
+    Returns:
+        (tuple): Tuple containing:
+
+            (dict): the visits of every action at the root
+            (int): the number of simulations
+    '''
+    if iterations is None and time_limit is None:
+        raise ValueError('Set iterations or time_limit')
+    rng = random.Random(seed)
+    determinizer = Determinizer(raw_state)
+    root = Node()
+    deadline = None if time_limit is None else time.time() + time_limit
+    simulations = 0
+    while iterations is None or simulations < iterations:
+        if deadline is not None and time.time() >= deadline:
+            break
+        simulator = determinizer.simulator(rng)
+        node = root
+
+        # select and expand
+        while simulator.winner is None:
+            legal_actions = simulator.legal_actions()
+            untried = []
+            for action in legal_actions:
+                child = node.children.get(action)
+                if child is None:
+                    untried.append(action)
+                else:
+                    child.avails += 1
+            player = simulator.current
+            if untried:
+                action = untried[rng.randrange(len(untried))]
+                node.children[action] = node = Node(node, action, player)
+                simulator.step(action)
+                break
+            node = node.select(legal_actions, exploration)
+            simulator.step(node.action)
+
+        # rollout
+        while simulator.winner is None:
+            simulator.step(rollout_policy(simulator, simulator.legal_actions(), rng))
+
+        # backpropagate the win of the players
+        while node is not None:
+            node.visits += 1
+            if node.player == simulator.winner:
+                node.wins += 1
+            node = node.parent
+        simulations += 1
+    return {action: child.visits for action, child in root.children.items()}, simulations
+
+
+def _search_task(args):
+    raw_state, iterations, time_limit, exploration, seed = args
+    return search(raw_state, iterations, time_limit, exploration, seed)
+
+
+class ISMCTSAgent(object):
+    ''' Information set Monte Carlo tree search agent
+
+    The hidden hands are determinized for every simulation, see Determinizer.
+    With workers > 1 the search is root-parallel: every worker grows its own
+    tree on a share of the budget and the root visits are summed. The pool of
+    the workers is shut down by close(), at the end of a with block, or when
+    the agent is garbage collected or the interpreter exits.
+    '''
+
+    def __init__(self, iterations=1000, time_limit=None, exploration=0.7, workers=1,
+                 executor='process', seed=None):
+        ''' Initilize the agent
+
+        Args:
+            iterations (int): simulations per move, shared by the workers
+            time_limit (float): seconds per move, used when iterations is None
+            exploration (float): the exploration constant of UCB1
+            workers (int): the number of parallel searches
+            executor (str): 'process' or 'thread', the workers of the searches
+            seed (int): the seed of the searches
+        '''
+        self.use_raw = True
+        self.iterations = iterations
+        self.time_limit = time_limit
+        self.exploration = exploration
+        self.workers = workers
+        self.executor = executor
+        self.rng = random.Random(seed)
+        self._pool = None
+        self._finalizer = None
+        # simulations and seconds of the last search
+        self.last_simulations = 0
+        self.last_seconds = 0.
+
+    @property
+    def simulations_per_second(self):
+        ''' Simulations per second of the last search
+        '''
+        return self.last_simulations / self.last_seconds if self.last_seconds else 0.
+
+    def _get_pool(self):
+        if self._pool is None:
+            pool_class = ProcessPoolExecutor if self.executor == 'process' else ThreadPoolExecutor
+            self._pool = pool_class(max_workers=self.workers)
+            # the finalizer holds the pool only, so it does not keep the agent alive
+            self._finalizer = weakref.finalize(self, self._pool.shutdown)
+        return self._pool
+
+    def close(self):
+        ''' Shut the workers down
+        '''
+        if self._pool is not None:
+            self._finalizer()
+            self._pool = None
+            self._finalizer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def search(self, state):
+        ''' Search the state
+
+        Args:
+            state (dict): An dictionary that represents the current state
+
+        Returns:
+            (dict): the root visits of every legal action
+        '''
+        raw_state = {key: value for key, value in state['raw_obs'].items()
+                     if key in ('self', 'current_hand', 'others_hand', 'trace') or key.startswith('remain_')}
+        start = time.time()
+        if self.workers > 1:
+            iterations = None if self.iterations is None else -(-self.iterations // self.workers)
+            tasks = [(raw_state, iterations, self.time_limit, self.exploration, self.rng.getrandbits(32))
+                     for _ in range(self.workers)]
+            visits, simulations = {}, 0
+            for worker_visits, worker_simulations in self._get_pool().map(_search_task, tasks):
+                for action, count in worker_visits.items():
+                    visits[action] = visits.get(action, 0) + count
+                simulations += worker_simulations
+        else:
+            visits, simulations = search(raw_state, self.iterations, self.time_limit,
+                                         self.exploration, self.rng.getrandbits(32))
+        self.last_simulations = simulations
+        self.last_seconds = time.time() - start
+        return visits
+
+    def step(self, state):
+        ''' Predict the action given the curent state in gerenerating training data.
+
+        Args:
+            state (dict): An dictionary that represents the current state
+
+        Returns:
+            action (str): The action with the most visits
+        '''
+        return self.eval_step(state)[0]
+
+    def eval_step(self, state):
+        ''' Predict the action given the current state for evaluation.
+
+        Args:
+            state (dict): An dictionary that represents the current state
+
+        Returns:
+            action (str): The action with the most visits
+            probs (dict): The share of the visits of every legal action
+        '''
+        legal_actions = state['raw_obs']['actions']
+        current_hand = state['raw_obs']['current_hand']
+        # Win the game if possible, or no choice
+        if current_hand in legal_actions:
+            return current_hand, {current_hand: 1.}
+        if len(legal_actions) == 1:
+            return legal_actions[0], {legal_actions[0]: 1.}
+
+        visits = self.search(state)
+        total = sum(visits.values())
+        probs = {action: count / total for action, count in visits.items()}
+        action = max(sorted(visits), key=visits.get)
+        return action, probs
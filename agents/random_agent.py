@@ -39,7 +39,8 @@ class RandomAgent(object):
             action (int): The action predicted (randomly chosen) by the random agent
             probs (list): The list of action probabilities
         '''
-        probs = [1/len(state['legal_actions'])] * self.action_num
+        # uniform over the legal actions, the agent has no action space of its own
+        probs = [1/len(state['legal_actions'])] * len(state['legal_actions'])
         # probs = [0 for _ in range(self.action_num)]
         # for i in state['legal_actions']:
         #     probs[i] = 1/len(state['legal_actions'])
@@ -0,0 +1,281 @@
+''' Benchmarks of the engine, the env and the agents
+
+Every benchmark times each call of the operation it measures and reports
+the operations per second, the percentiles of the latency of a call and the
+peak memory allocated while it runs (tracemalloc, in a second pass so that
+tracing does not slow down the timed pass). All the inputs are drawn from
+seeded generators, so two runs measure the same work.
+
+Usage:
+    python benchmark.py                                # print the results
+    python benchmark.py --save baseline.json           # save a baseline
+    python benchmark.py --compare baseline.json        # exit 1 on a regression
+    python benchmark.py --only movegen,game_step --scale 0.2
+
+A result regresses when its operations per second fall, or its peak memory
+grows, by more than the tolerance relative to the baseline. Only runs of the
+same scale and seed are compared, and the throughput of a benchmark is only
+compared when it made at least MIN_CALLS calls over MIN_SECONDS, shorter
+runs are too noisy.
+'''
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import tracemalloc
+from collections import OrderedDict
+
+import numpy as np
+
+from pdkutils import DECK_48, CARD_INDEX_RANK, sort_card
+from pdkmovegen import MOVE_CACHE, hand2counts, playable_codes_from_counts, gt_cards_from_hand
+
+
+# the least calls, and seconds of calls, of a benchmark whose throughput is compared with the baseline
+MIN_CALLS = 100
+MIN_SECONDS = 0.2
+
+
+def _hands(rng, num, sizes=(16,)):
+    ''' Random sorted hands of the 48-card deck, of the given sizes
+    '''
+    hands = []
+    for index in range(num):
+        cards = rng.choice(len(DECK_48), sizes[index % len(sizes)], replace=False)
+        hands.append(sort_card([CARD_INDEX_RANK[card] for card in cards]))
+    return hands
+
+
+def bench_movegen(measure, rng, number):
+    ''' Generate all the playable moves of a hand, without the cache
+    '''
+    for hand in _hands(rng, number, sizes=(16, 12, 8, 5)):
+        measure(playable_codes_from_counts, hand2counts(hand))
+
+
+def bench_lead(measure, rng, number):
+    ''' Get the legal leads of a hand through the move cache, as the judger does
+    '''
+    hands = _hands(rng, 256, sizes=(16, 12, 8, 5))
+    MOVE_CACHE.clear()
+    for index in range(number):
+        measure(MOVE_CACHE.playable_moves, hands[index % len(hands)])
+
+
+def bench_response(measure, rng, number):
+    ''' Get the legal responses of a hand to cards led by another hand
+    '''
+    hands = _hands(rng, 2 * number, sizes=(16, 12, 8, 5))
+    for index in range(number):
+        leads = sorted(MOVE_CACHE.playable_moves(hands[2 * index]))
+        target = leads[rng.randint(len(leads))]
+        measure(gt_cards_from_hand, hands[2 * index + 1], target)
+
+
+def bench_game_step(measure, rng, number):
+    ''' PaodekuaiGame.step with random legal actions
+    '''
+    from pdkgame import PaodekuaiGame
+
+    game = PaodekuaiGame()
+    game.np_random = np.random.RandomState(rng.randint(2 ** 31))
+    steps = 0
+    while steps < number:
+        game.init_game()
+        while not game.is_over() and steps < number:
+            actions = sorted(game.state['actions'])
+            measure(game.step, actions[rng.randint(len(actions))])
+            steps += 1
+
+
+def _bench_env_run(measure, rng, number, agent_class):
+    from pdkenv import PaodekuaiEnv
+
+    # the agents draw from the global generators
+    np.random.seed(rng.randint(2 ** 31))
+    random.seed(rng.randint(2 ** 31))
+    env = PaodekuaiEnv({'seed': rng.randint(2 ** 31), 'record_action': False})
+    env.set_agents([agent_class() for _ in range(env.player_num)])
+    for _ in range(number):
+        measure(env.run, True)
+
+
+def bench_env_run_random(measure, rng, number):
+    ''' A full env.run of RandomAgents
+    '''
+    from agents.random_agent import RandomAgent
+    _bench_env_run(measure, rng, number, RandomAgent)
+
+
+def bench_env_run_rule(measure, rng, number):
+    ''' A full env.run of RuleAgents
+    '''
+    from agents.rule_agent import RuleAgent
+    _bench_env_run(measure, rng, number, RuleAgent)
+
+
+def bench_encode_obs(measure, rng, number):
+    ''' PaodekuaiEnv._extract_state of the states of random games
+    '''
+    from pdkenv import PaodekuaiEnv
+
+    env = PaodekuaiEnv({'seed': rng.randint(2 ** 31), 'record_action': False})
+    states = []
+    while len(states) < min(number, 512):
+        env.reset()
+        while not env.is_over():
+            states.append(env.game.state)
+            actions = sorted(env.game.state['actions'])
+            env.step(actions[rng.randint(len(actions))], True)
+    for index in range(number):
+        measure(env._extract_state, states[index % len(states)])
+
+
+# name -> (function, number of operations at scale 1)
+# at scale 1 every benchmark lasts more than MIN_SECONDS
+BENCHMARKS = OrderedDict([('movegen', (bench_movegen, 10000)),
+                          ('lead', (bench_lead, 100000)),
+                          ('response', (bench_response, 5000)),
+                          ('game_step', (bench_game_step, 10000)),
+                          ('env_run_random', (bench_env_run_random, 200)),
+                          ('env_run_rule', (bench_env_run_rule, 100)),
+                          ('encode_obs', (bench_encode_obs, 10000))])
+
+
+def run_benchmark(name, scale=1., seed=0):
+    ''' Run a benchmark, timed and then traced
+
+    Args:
+        name (str): the name of the benchmark in BENCHMARKS
+        scale (float): the multiplier of the number of operations
+        seed (int): the seed of the inputs
+
+    Returns:
+        (dict): calls, ops_per_sec, p50_us, p90_us, p99_us and peak_kb
+    '''
+    function, number = BENCHMARKS[name]
+    number = max(int(number * scale), 1)
+    latencies = []
+    perf_counter_ns = time.perf_counter_ns
+
+    def measure(operation, *args):
+        start = perf_counter_ns()
+        res = operation(*args)
+        latencies.append(perf_counter_ns() - start)
+        return res
+
+    function(measure, np.random.RandomState(seed), number)
+    latencies = np.array(latencies) / 1e3
+
+    def call(operation, *args):
+        return operation(*args)
+
+    tracemalloc.start()
+    try:
+        function(call, np.random.RandomState(seed), number)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {'calls': len(latencies),
+            'ops_per_sec': len(latencies) / (latencies.sum() / 1e6),
+            'p50_us': float(np.percentile(latencies, 50)),
+            'p90_us': float(np.percentile(latencies, 90)),
+            'p99_us': float(np.percentile(latencies, 99)),
+            'peak_kb': peak / 1024}
+
+
+def is_timed(result, min_calls=MIN_CALLS):
+    ''' Whether a result made enough calls over enough time to compare its throughput
+    '''
+    return result['calls'] >= min_calls and result['calls'] / result['ops_per_sec'] >= MIN_SECONDS
+
+
+def compare(results, baseline, tolerance, min_calls=MIN_CALLS):
+    ''' Find the results which regress against the baseline
+
+    Args:
+        results (dict): name -> result of run_benchmark
+        baseline (dict): the saved baseline
+        tolerance (float): the allowed relative regression
+        min_calls (int): the least calls of a benchmark whose throughput is compared,
+            which must also last MIN_SECONDS
+
+    Returns:
+        (list): the messages of the regressions
+    '''
+    regressions = []
+    for name, result in results.items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        if is_timed(result, min_calls) and result['ops_per_sec'] < base['ops_per_sec'] * (1 - tolerance):
+            regressions.append('{}: {:.1f} ops/s, baseline {:.1f}'.format(
+                name, result['ops_per_sec'], base['ops_per_sec']))
+        # 64 KB of slack, the peaks of the small benchmarks are a few allocations
+        if result['peak_kb'] > base['peak_kb'] * (1 + tolerance) + 64:
+            regressions.append('{}: {:.0f} KB peak, baseline {:.0f}'.format(
+                name, result['peak_kb'], base['peak_kb']))
+    return regressions
+
+
+def format_results(results, baseline=None):
+    lines = ['{:<16}{:>8}{:>12}{:>10}{:>10}{:>10}{:>11}{:>9}'.format(
+        'benchmark', 'calls', 'ops/s', 'p50 us', 'p90 us', 'p99 us', 'peak KB', 'vs base')]
+    for name, result in results.items():
+        base = baseline['results'].get(name) if baseline else None
+        change = '{:+.1%}'.format(result['ops_per_sec'] / base['ops_per_sec'] - 1) if base else ''
+        lines.append('{:<16}{:>8}{:>12.1f}{:>10.1f}{:>10.1f}{:>10.1f}{:>11.0f}{:>9}'.format(
+            name, result['calls'], result['ops_per_sec'], result['p50_us'], result['p90_us'],
+            result['p99_us'], result['peak_kb'], change))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks of the Paodekuai engine, env and agents')
+    parser.add_argument('--only', help='comma separated benchmarks, all by default')
+    parser.add_argument('--scale', type=float, default=1., help='multiplier of the number of operations')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help='save the results as a baseline json')
+    parser.add_argument('--compare', help='baseline json to compare with, exit 1 on a regression')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression')
+    parser.add_argument('--min-calls', type=int, default=MIN_CALLS,
+                        help='least calls of a benchmark whose throughput is compared')
+    args = parser.parse_args(argv)
+
+    names = args.only.split(',') if args.only else list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error('Unknown benchmark {}, choose from {}'.format(name, ', '.join(BENCHMARKS)))
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            baseline = json.load(file)
+        # other scales or seeds measure other workloads
+        if baseline['scale'] != args.scale or baseline['seed'] != args.seed:
+            parser.error('The baseline was run with --scale {} --seed {}, not --scale {} --seed {}'.format(
+                baseline['scale'], baseline['seed'], args.scale, args.seed))
+
+    results = OrderedDict((name, run_benchmark(name, args.scale, args.seed)) for name in names)
+    print(format_results(results, baseline))
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump({'python': platform.python_version(), 'machine': platform.machine(),
+                       'scale': args.scale, 'seed': args.seed, 'results': results}, file, indent=2)
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance, args.min_calls)
+        for name, result in results.items():
+            if not is_timed(result, args.min_calls):
+                print('NOTE {}: {} calls in {:.3f} s, too few to compare the throughput'.format(
+                    name, result['calls'], result['calls'] / result['ops_per_sec']))
+        for message in regressions:
+            print('REGRESSION ' + message)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,178 @@
+''' Sharded supervised datasets of (observation, action plane) records
+
+A dataset is a directory of shards written in chunks of fixed size:
+
+    manifest.json       the shards, their sizes and the games played so far
+    x_00000.npy         uint8 (n, 6, 4, 13) observations
+    y_00000.npy         uint8 (n, 4, 13) planes of the actions played
+    ...
+
+The manifest is replaced atomically once a shard is written, so a run which
+stops halfway keeps every shard listed in the manifest and can be resumed.
+The shards are memory-mapped on reading.
+'''
+import os
+import json
+
+import numpy as np
+
+MANIFEST_FILE = 'manifest.json'
+X_SHAPE = (6, 4, 13)
+Y_SHAPE = (4, 13)
+
+
+def read_manifest(path):
+    ''' Read the manifest of the dataset in path, an empty one if there is none
+    '''
+    file = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(file):
+        return {'shards': [], 'samples': 0, 'games': 0}
+    with open(file, 'r') as f:
+        return json.load(f)
+
+
+class ShardedDatasetWriter(object):
+    ''' Append records to a sharded dataset, a chunk at a time
+    '''
+
+    def __init__(self, path, chunk_size=1 << 16, new=False):
+        ''' Open the dataset in path, the shards are appended after the existing ones
+
+        Args:
+            path (str): the directory of the dataset
+            chunk_size (int): the records of a shard
+            new (boolean): drop the existing shards
+        '''
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.chunk_size = chunk_size
+        if new:
+            for shard in read_manifest(path)['shards']:
+                for file in (shard['x'], shard['y']):
+                    if os.path.exists(os.path.join(path, file)):
+                        os.remove(os.path.join(path, file))
+            if os.path.exists(os.path.join(path, MANIFEST_FILE)):
+                os.remove(os.path.join(path, MANIFEST_FILE))
+        self.manifest = read_manifest(path)
+        self.x = np.zeros((chunk_size,) + X_SHAPE, dtype=np.uint8)
+        self.y = np.zeros((chunk_size,) + Y_SHAPE, dtype=np.uint8)
+        self.size = 0
+        # games finished since the last flush
+        self.games = 0
+
+    @property
+    def samples(self):
+        ''' The records written, including the buffered ones
+        '''
+        return self.manifest['samples'] + self.size
+
+    @property
+    def total_games(self):
+        ''' The games finished, including those since the last flush
+        '''
+        return self.manifest['games'] + self.games
+
+    def append(self, obs, action_plane):
+        ''' Buffer one record, and write the chunk once it is full
+        '''
+        self.x[self.size] = obs
+        self.y[self.size] = action_plane
+        self.size += 1
+        if self.size == self.chunk_size:
+            self.flush()
+
+    def end_game(self):
+        ''' Count a finished game
+        '''
+        self.games += 1
+
+    def flush(self):
+        ''' Write the buffered records into a new shard and update the manifest
+        '''
+        if self.size:
+            index = len(self.manifest['shards'])
+            shard = {'x': 'x_{:05d}.npy'.format(index), 'y': 'y_{:05d}.npy'.format(index), 'size': self.size}
+            np.save(os.path.join(self.path, shard['x']), self.x[:self.size])
+            np.save(os.path.join(self.path, shard['y']), self.y[:self.size])
+            self.manifest['shards'].append(shard)
+            self.manifest['samples'] += self.size
+            self.size = 0
+        self.manifest['games'] += self.games
+        self.games = 0
+        tmp_file = os.path.join(self.path, MANIFEST_FILE + '.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_file, os.path.join(self.path, MANIFEST_FILE))
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ShardedDataset(object):
+    ''' Read a sharded dataset, the shards are memory-mapped
+    '''
+
+    def __init__(self, path):
+        ''' Open the dataset in path
+
+        Args:
+            path (str): the directory of the dataset
+        '''
+        self.path = path
+        self.manifest = read_manifest(path)
+        self.shards = [(np.load(os.path.join(path, shard['x']), mmap_mode='r'),
+                        np.load(os.path.join(path, shard['y']), mmap_mode='r'))
+                       for shard in self.manifest['shards']]
+        self.offsets = np.cumsum([0] + [shard['size'] for shard in self.manifest['shards']])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        shard = np.searchsorted(self.offsets, index, side='right') - 1
+        x, y = self.shards[shard]
+        return x[index - self.offsets[shard]], y[index - self.offsets[shard]]
+
+    def iter_chunks(self):
+        ''' Iterate the (x, y) arrays of the shards
+        '''
+        return iter(self.shards)
+
+    def load(self, dtype=np.float32):
+        ''' Read the whole dataset in memory
+
+        Returns:
+            (tuple): the observations and the action planes, as arrays of dtype
+        '''
+        x = np.empty((len(self),) + X_SHAPE, dtype=dtype)
+        y = np.empty((len(self),) + Y_SHAPE, dtype=dtype)
+        for (shard_x, shard_y), start, end in zip(self.shards, self.offsets[:-1], self.offsets[1:]):
+            x[start:end] = shard_x
+            y[start:end] = shard_y
+        return x, y
+
+
+def winner_records(env, episode_num):
+    ''' Play games and yield the non-pass actions of the winners
+
+    Args:
+        env (Env): the env with its agents set
+        episode_num (int): the games to play
+
+    Yields:
+        (tuple): (obs, action) of a record, or None once a game is finished
+    '''
+    for _ in range(episode_num):
+        trajectories, _ = env.run(is_training=False)
+        for state, action, _, _, _ in trajectories[env.game.winner_id]:
+            if action != 'pass':
+                yield state['obs'], action
+        yield None
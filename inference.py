@@ -0,0 +1,247 @@
+''' Batched inference for the neural agents
+
+An InferenceServer collects the observations of many games, in threads of
+the process or in other processes over pipes, and runs the model on them as
+one batch: a batch is run once it holds max_batch_size observations, or
+max_wait seconds after its first observation arrived.
+
+Example:
+    server = InferenceServer(torch_model_fn(model), max_batch_size=64).start()
+    agents = [SL_Agent('deepcard_model_win', inference=server) for _ in range(3)]
+    ...
+    conn = server.connect()   # pass conn to a worker process
+    client = InferenceClient(conn)
+    prediction = client.predict(obs)
+'''
+import time
+import queue
+import threading
+import multiprocessing as mp
+from concurrent.futures import Future
+
+import numpy as np
+
+
+def torch_model_fn(model):
+    ''' Wrap a torch model into a function from a numpy batch to a numpy batch
+    '''
+    import torch
+
+    def model_fn(batch):
+        with torch.no_grad():
+            model.eval()
+            return model(torch.from_numpy(batch)).numpy()
+    return model_fn
+
+
+class Histogram(object):
+    ''' Counts of values in fixed bins
+    '''
+
+    def __init__(self, edges):
+        ''' Initialize the histogram
+
+        Args:
+            edges (list): the increasing left edges of the bins, a value below
+                edges[0] is counted in the first bin
+        '''
+        self.edges = np.asarray(edges, dtype=float)
+        self.counts = np.zeros(len(self.edges), dtype=np.int64)
+        self.total = 0.
+        self.lock = threading.Lock()
+
+    def add(self, values):
+        ''' Count one value or an array of values
+        '''
+        values = np.atleast_1d(np.asarray(values, dtype=float))
+        bins = np.maximum(np.searchsorted(self.edges, values, side='right') - 1, 0)
+        with self.lock:
+            np.add.at(self.counts, bins, 1)
+            self.total += values.sum()
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    def percentile(self, q):
+        ''' The left edge of the bin of the q-th percentile
+        '''
+        count = self.count
+        if not count:
+            return 0.
+        index = np.searchsorted(np.cumsum(self.counts), q / 100. * count)
+        return float(self.edges[min(index, len(self.edges) - 1)])
+
+    def summary(self):
+        ''' Get the count, the mean and the percentiles 50, 90 and 99
+        '''
+        count = self.count
+        return {'count': count,
+                'mean': float(self.total / count) if count else 0.,
+                'p50': self.percentile(50),
+                'p90': self.percentile(90),
+                'p99': self.percentile(99)}
+
+
+class InferenceServer(object):
+    ''' Run the requests of many callers through the model in batches
+    '''
+
+    def __init__(self, model_fn, max_batch_size=64, max_wait=0.002):
+        ''' Initialize the server
+
+        Args:
+            model_fn (callable): float32 numpy batch of observations -> numpy batch of outputs
+            max_batch_size (int): the most observations in a batch
+            max_wait (float): the most seconds a batch waits for more observations
+        '''
+        self.model_fn = model_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        self.buffer = None
+        self.thread = None
+        self.readers = []
+        # seconds from a request to its result, and observations per batch
+        self.latency = Histogram(np.concatenate([[0], np.geomspace(1e-5, 10, 61)]))
+        self.batch_size = Histogram(np.arange(1, max_batch_size + 1))
+
+    def start(self):
+        ''' Start the batching thread
+        '''
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        ''' Stop the batching thread once the queued requests are done
+        '''
+        if self.thread is not None:
+            self.requests.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def submit(self, obs):
+        ''' Queue one observation
+
+        Args:
+            obs (numpy.array): the observation of a player
+
+        Returns:
+            (Future): the future of the output of the model for obs
+        '''
+        future = Future()
+        self.requests.put((obs, future, time.time()))
+        return future
+
+    def predict(self, obs):
+        ''' Get the output of the model for obs, waiting for its batch
+        '''
+        return self.submit(obs).result()
+
+    def _next_batch(self):
+        ''' Wait for a batch of requests, None once stopped
+        '''
+        request = self.requests.get()
+        if request is None:
+            return None
+        batch = [request]
+        deadline = time.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.time()
+            try:
+                request = self.requests.get(timeout=timeout) if timeout > 0 else self.requests.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                # run the batch, then stop
+                self.requests.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            num = len(batch)
+            shape = np.shape(batch[0][0])
+            if self.buffer is None or self.buffer.shape[1:] != shape:
+                self.buffer = np.zeros((self.max_batch_size,) + shape, dtype=np.float32)
+            try:
+                for index, (obs, _, _) in enumerate(batch):
+                    self.buffer[index] = obs
+                outputs = self.model_fn(self.buffer[:num])
+            except Exception as error:
+                for _, future, _ in batch:
+                    future.set_exception(error)
+                continue
+            now = time.time()
+            self.batch_size.add(num)
+            self.latency.add([now - start for _, _, start in batch])
+            for index, (_, future, _) in enumerate(batch):
+                future.set_result(outputs[index])
+
+    def connect(self):
+        ''' Open a pipe to the server for an InferenceClient in another process
+
+        Returns:
+            (Connection): the end of the pipe of the client
+        '''
+        server_conn, client_conn = mp.Pipe()
+        reader = threading.Thread(target=self._serve, args=(server_conn,), daemon=True)
+        reader.start()
+        self.readers.append(reader)
+        return client_conn
+
+    def _serve(self, conn):
+        ''' Forward the requests of a pipe until the client closes it
+        '''
+        def reply(future):
+            error = future.exception()
+            conn.send((error is None, future.result() if error is None else error))
+
+        while True:
+            try:
+                obs = conn.recv()
+            except EOFError:
+                conn.close()
+                return
+            self.submit(obs).add_done_callback(reply)
+
+    def stats(self):
+        ''' Get the summaries of the latency and batch size histograms
+        '''
+        return {'latency': self.latency.summary(), 'batch_size': self.batch_size.summary()}
+
+
+class InferenceClient(object):
+    ''' The client of an InferenceServer in another process
+    '''
+
+    def __init__(self, conn):
+        ''' Initialize the client
+
+        Args:
+            conn (Connection): the pipe returned by InferenceServer.connect
+        '''
+        self.conn = conn
+
+    def predict(self, obs):
+        ''' Get the output of the model for obs
+        '''
+        self.conn.send(obs)
+        ok, result = self.conn.recv()
+        if not ok:
+            raise result
+        return result
+
+    def close(self):
+        self.conn.close()
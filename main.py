@@ -6,9 +6,9 @@ import seaborn as sns
 import numpy as np
 from tqdm import tqdm
 from matplotlib import pyplot as plt
-from SL_card import cards_encode_tensor
 
 from pdkenv import PaodekuaiEnv
+from dataset import ShardedDatasetWriter, ShardedDataset, winner_records
 from agents.random_agent import RandomAgent
 from agents.human_agent import HumanAgent
 from agents.deepcard_agent import SL_Agent as Deepcard
@@ -75,32 +75,21 @@ fig.savefig('results/agents_fight.png')
 
 
 # generating data
-def generate_data(new=True):
-    if new:
-        generated_data_x = np.array([]).reshape(-1, 6, 4, 13)
-        generated_data_y = np.array([]).reshape(-1, 4, 13)
-    else:
-        generated_data_x = np.load(DATA_PATH + 'card_tensor_data_x_' + 'gen' + '.npy')
-        generated_data_y = np.load(DATA_PATH + 'card_tensor_data_y_' + 'gen' + '.npy')
-    episode_num = 5000
-    for epoc in tqdm(range(episode_num)):
-        trajectories, payoffs = env.run(is_training=False)
-        # if env.game.winner_id == 0:
-        winner_id = env.game.winner_id
-        # record winner behaviors
-        for markov_action in trajectories[winner_id]:
-            # if action is not 'pass'
-            if markov_action[1] != 'pass':
-                generated_data_x = np.concatenate([generated_data_x, [markov_action[0]['obs']]])
-                generated_data_y = np.concatenate([generated_data_y, [cards_encode_tensor(markov_action[1])]])
-
-            # generated_data_x.append(markov_action[0]['obs'])
-         # generated_data_y.append(cards_encode_tensor(markov_action[1]))
-
-    np.save(DATA_PATH + 'card_tensor_data_x_gen', np.array(generated_data_x))
-    np.save(DATA_PATH + 'card_tensor_data_y_gen', np.array(generated_data_y))
-
-
-# np.array(data_X.tolist()) == data_X, b = np.concate([a,b])
-data_X, data_Y = np.load(DATA_PATH + 'card_tensor_data_x_' + 'gen' + '.npy'), \
-                 np.load(DATA_PATH + 'card_tensor_data_y_' + 'gen' + '.npy')
+def generate_data(new=True, episode_num=5000, chunk_size=1 << 16):
+    """ Stream the actions of the winners into the sharded dataset card_tensor_data_gen
+
+    :param new: start a new dataset, otherwise resume or extend the existing one
+    :param episode_num: the games the dataset holds once done
+    :param chunk_size: the records of a shard
+    """
+    with ShardedDatasetWriter(DATA_PATH + 'card_tensor_data_gen', chunk_size=chunk_size, new=new) as writer:
+        for record in tqdm(winner_records(env, max(episode_num - writer.total_games, 0)), unit='sample'):
+            if record is None:
+                writer.end_game()
+                continue
+            obs, action = record
+            # record winner behaviors
+            writer.append(obs, env.get_action_planes([action])[0])
+
+
+data_X, data_Y = ShardedDataset(DATA_PATH + 'card_tensor_data_gen').load()
@@ -10,10 +10,11 @@ class Card(object):
         Similarly the rank variable should be one of [A, 2, 3, 4, 5, 6, 7, 8, 9, T, J, Q, K]
     '''
 
-    suit = None
-    rank = None
+    __slots__ = ('suit', 'rank')
     valid_suit = ['S', 'H', 'D', 'C', 'BJ', 'RJ']
     valid_rank = ['A', '2', '3', '4', '5', '6', '7', '8', '9', 'T', 'J', 'Q', 'K']
+    _suit_index = {suit: index for index, suit in enumerate(valid_suit)}
+    _rank_index = {rank: index for index, rank in enumerate(valid_rank)}
 
     def __init__(self, suit, rank):
         ''' Initialize the suit and rank of a card
@@ -33,9 +34,8 @@ class Card(object):
             return NotImplemented
 
     def __hash__(self):
-        suit_index = Card.valid_suit.index(self.suit)
-        rank_index = Card.valid_rank.index(self.rank)
-        return rank_index + 100 * suit_index
+        # jokers have the rank '', which is not a valid rank
+        return Card._rank_index.get(self.rank, -1) + 100 * Card._suit_index[self.suit]
 
     def __str__(self):
         ''' Get string representation of a card.
@@ -2,26 +2,25 @@
 ''' Implement Paodekuai Dealer class
 '''
 
-import functools
 import random
-from pdkutils import init_48_deck
-from pdkutils import cards2str, cards2str_with_suit, paodekuai_sort_card
+from pdkutils import DECK_48, CARD_INDEX_RANK_ID
+from pdkutils import cards2str_with_suit
 
 
 class PaodekuaiDealer(object):
     ''' Dealer will shuffle, deal cards, and determine players' roles
     '''
     num_split = 3
+    __slots__ = ('np_random', 'deck')
 
     def __init__(self, np_random):
         '''Give dealer the deck
 
         Notes:
-            1. deck with 54 cards including black joker and red joker
+            1. deck with 48 cards, every card is its index in pdkutils.DECK_48
         '''
         self.np_random = np_random
-        self.deck = init_48_deck()
-        self.deck.sort(key=functools.cmp_to_key(paodekuai_sort_card))
+        self.deck = list(range(len(DECK_48)))
         # sorted to '3333444455556666777788889999TTTTJJJJQQQQKKKKAAA2'
 
     def shuffle(self):
@@ -40,9 +39,10 @@ class PaodekuaiDealer(object):
 
         for index, player in enumerate(players):
             current_hand = self.deck[index * hand_num:(index + 1) * hand_num]
-            current_hand.sort(key=functools.cmp_to_key(paodekuai_sort_card))
+            # sort by rank only, the cards of a rank stay in the dealt order
+            current_hand.sort(key=CARD_INDEX_RANK_ID.__getitem__)
             player.set_current_hand(current_hand)
-            player.initial_hand = cards2str(player.current_hand)
+            player.initial_hand = player.current_hand_str
 
     # The player who got 'S3' will go first
     def determine_first(self, players, game_rule=False, random_deal=True):
@@ -12,6 +12,9 @@ DEFAULT_CONFIG = {
     'record_action': True,
     'seed': None,
     'env_num': 1,
+    'action_ids': False,  # legal actions as an int array of specific action ids
+    'obs_dtype': int,  # dtype of state['obs'], e.g. np.uint8 or bool to save memory
+    'profile': False,  # time the phases of the steps with profiling.PROFILER, reported at exit
 }
 BOMB = ['3' * 4, '4' * 4, '5'* 4, '6'* 4, '7'* 4, '8'* 4, '9'* 4, 'T'* 4, 'J'* 4, 'Q'* 4, 'K'* 4, 'A'* 3]
 
@@ -43,6 +46,13 @@ class Env(object):
                 'active_player' (int) - If 'singe_agent_mode' is True,
                  'active_player' specifies the player that does not use
                   pretrained models.
+                'action_ids' (boolean) - True if state['legal_actions'] is an
+                 int array of specific action ids (see pdktables) and the
+                 agents may step with the ids instead of raw actions.
+                'obs_dtype' (numpy.dtype) - The dtype of state['obs'], the
+                 planes only hold 0 and 1 so np.uint8 or bool are enough.
+                'profile' (boolean) - True to enable profiling.PROFILER,
+                 its report is written to stderr when the process exits.
                 There can be some game specific configurations, e.g., the
                 number of players in the game. These fields should start with
                 'game_', e.g., 'game_player_num' we specify the number of
@@ -114,8 +124,8 @@ class Env(object):
             while not player_id == self.active_player:
                 self.timestep += 1
                 action, _ = self.model.agents[player_id].eval_step(self._extract_state(state))
-                # if not self.model.agents[player_id].use_raw:
-                #     action = self._decode_action(action)
+                if not self.model.agents[player_id].use_raw:
+                    action = self._decode_action(action)
                 state, player_id = self.game.step(action)
 
             if not self.game.is_over():
@@ -136,8 +146,8 @@ class Env(object):
                 (dict): The next state
                 (int): The ID of the next player
         '''
-        # if not raw_action:
-        #     action = self._decode_action(action)
+        if not raw_action:
+            action = self._decode_action(action)
         if self.single_agent_mode:
             return self._single_agent_step(action)
 
@@ -411,8 +421,8 @@ class Env(object):
         while not self.game.is_over() and not player_id == self.active_player:
             self.timestep += 1
             action, _ = self.model.agents[player_id].eval_step(self._extract_state(state))
-            # if not self.model.agents[player_id].use_raw:
-            #     action = self._decode_action(action)
+            if not self.model.agents[player_id].use_raw:
+                action = self._decode_action(action)
             state, player_id = self.game.step(action)
 
         if self.game.is_over():
@@ -436,8 +446,8 @@ class PaodekuaiEnv(Env):
 
     def __init__(self, config):
         from pdkutils import SPECIFIC_MAP, CARD_RANK_STR
-        from pdkutils import ACTION_LIST, ACTION_SPACE
-        from pdkutils import encode_cards, visual_cards
+        from pdkutils import ACTION_LIST, ACTION_SPACE, CARD_TABLES
+        from pdkutils import encode_cards, encode_planes, visual_cards
         from pdkutils import cards2str, cards2str_with_suit
         from pdkgame import PaodekuaiGame as Game
 
@@ -446,23 +456,50 @@ class PaodekuaiEnv(Env):
             _config[key] = config[key]
 
         self._encode_cards = encode_cards
+        self._encode_planes = encode_planes
         self._cards2str = cards2str
         self._cards2str_with_suit = cards2str_with_suit
         self._SPECIFIC_MAP = SPECIFIC_MAP
         self._CARD_RANK_STR = CARD_RANK_STR
         self._ACTION_LIST = ACTION_LIST
         self._ACTION_SPACE = ACTION_SPACE
+        self._CARD_TABLES = CARD_TABLES
+        self.action_ids = _config['action_ids']
+        self.obs_dtype = _config['obs_dtype']
+        if _config['profile']:
+            from profiling import PROFILER
+            if not PROFILER.enabled:
+                PROFILER.enable().dump_at_exit()
 
         self.name = 'paodekuai'
         self.game = Game()
         super(PaodekuaiEnv, self).__init__(_config)
         self.state_shape = [6, 4, 13]
+        if self.action_ids:
+            # the dense index of all specific actions, see pdktables
+            self.action_num = len(CARD_TABLES)
 
-    def _extract_state(self, state):
+    def set_agents(self, agents):
+        ''' Set the agents that will interact with the environment, see Env.set_agents
+
+        Raises:
+            ValueError: if an agent with use_raw is set in 'action_ids' mode, as
+                it would read action ids in state['legal_actions']
+        '''
+        if self.action_ids:
+            for agent in agents:
+                if agent.use_raw:
+                    raise ValueError('{} uses raw actions, it can not play in action_ids mode'.format(
+                        type(agent).__name__))
+        super(PaodekuaiEnv, self).set_agents(agents)
+
+    def _extract_state(self, state, out=None):
         ''' Encode state
 
         Args:
             state (dict): dict of original state
+            out (numpy.array): buffer of shape (6, 4, 13) to write the obs
+                into, a new array of dtype obs_dtype if None
 
         Returns:
             numpy array: 6*4*13 array
@@ -471,19 +508,20 @@ class PaodekuaiEnv(Env):
                              the recent three actions
                              the union of all played cards
         '''
-        obs = np.zeros((6, 4, 13), dtype=int)
-        # for index in range(6):
-        #     obs[index][0] = np.ones(13, dtype=int)
-        self._encode_cards(obs[0], state['current_hand'])
-        self._encode_cards(obs[1], state['others_hand'])
+        obs = np.empty((6, 4, 13), dtype=self.obs_dtype) if out is None else out
         # trace: from old to new, so the old is put in the bottom layer
+        recent = ['', '', '']
         for i, action in enumerate(state['trace'][-3:]):
             if action[1] != 'pass':
-                self._encode_cards(obs[4 - i], action[1])
-        if state['played_cards'] is not None:
-            self._encode_cards(obs[5], state['played_cards'])
-
-        extracted_state = {'obs': obs, 'legal_actions': self.game.state['actions']}  # self._get_legal_actions_id()
+                recent[2 - i] = action[1]
+        self._encode_planes(obs, [state['current_hand'], state['others_hand']]
+                            + recent + [state['played_cards']])
+
+        if self.action_ids:
+            legal_actions = self.encode_actions(self.game.state['actions'] or [])
+        else:
+            legal_actions = self.game.state['actions']
+        extracted_state = {'obs': obs, 'legal_actions': legal_actions}  # self._get_legal_actions_id()
         if self.allow_raw_data:
             extracted_state['raw_obs'] = state
             # TODO: state['actions'] can be None, may have bugs
@@ -510,6 +548,7 @@ class PaodekuaiEnv(Env):
         Returns:
             payoffs (list): a list of payoffs for each player
         '''
+        action = self._decode_action(action)
         reward = 0
         # be careful of the initial win!
         if len(next_state['raw_obs']['trace']) >= 2:
@@ -538,13 +577,110 @@ class PaodekuaiEnv(Env):
         ''' Action id -> the action in the game. Must be implemented in the child class.
 
         Args:
-            action_id (int): the id of the action
+            action_id (int): the id of the action, or the raw action which is returned as it is
 
         Returns:
             action (string): the action that will be passed to the game engine.
         '''
+        if self.action_ids and not isinstance(action_id, str):
+            return self._CARD_TABLES.decode_action(action_id)
         return action_id
 
+    def run_columnar(self, recorder, is_training=False):
+        ''' Run a complete game as run does, writing the transitions into recorder
+
+        The transitions are not kept as lists of state dicts: only the
+        observations, action ids, rewards, done flags, players and turns are
+        written into the columns of recorder, see trajectory.py.
+
+        Args:
+            recorder (TrajectoryRecorder): the recorder of the transitions
+            is_training (boolean): True if for training purpose.
+
+        Returns:
+            (tuple) Tuple containing:
+
+                (TrajectoryBatch): views of the transitions of the game in recorder
+                (list): the rewards [player_id, reward] in the order they were given
+        '''
+        if self.single_agent_mode:
+            raise ValueError('Run in single agent not allowed.')
+
+        start = len(recorder)
+        self._CARD_TABLES.load()
+        index = self._CARD_TABLES.index
+        state, player_id = self.reset()
+        reward_seq = []
+        # (row, state, action) of the last transition of every player
+        pending = [None] * self.player_num
+        step = 0
+        while not self.is_over():
+            agent = self.agents[player_id]
+            if not is_training:
+                action, _ = agent.eval_step(state)
+            else:
+                action = agent.step(state)
+            action_id = index[action] if isinstance(action, str) else action
+            pending[player_id] = (recorder.add(state['obs'], action_id, player_id, step), state, action)
+            step += 1
+
+            state, player_id = self.step(action, agent.use_raw)
+            if not self.game.is_over() and pending[player_id]:
+                row, old_state, old_action = pending[player_id]
+                reward = self.transition_reward(old_state, old_action, state, player_id)
+                reward_seq += [[player_id, reward]]
+                recorder.set_reward(row, reward)
+            winner = player_id
+
+        # the final transitions of all the players
+        for i in range(self.player_num):
+            player_id = (winner + i) % self.player_num
+            if pending[player_id]:
+                row, old_state, old_action = pending[player_id]
+                reward = self.transition_reward(old_state, old_action, self.get_state(player_id), player_id)
+                reward_seq += [[player_id, reward]]
+                recorder.set_reward(row, reward, done=True)
+
+        self.reward_recoder = reward_seq
+        return recorder.batch(start), reward_seq
+
+    def encode_actions(self, actions):
+        ''' Specific actions -> their ids in the dense index of all specific actions
+
+        Args:
+            actions (list): a list of specific actions, e.g. ['33345', 'pass']
+
+        Returns:
+            (numpy.array): int32 array of the action ids
+        '''
+        return self._CARD_TABLES.encode_actions(actions)
+
+    def get_action_planes(self, actions, out=None):
+        ''' Gather the (4, 13) planes of actions from the shared table of all specific actions
+
+        Args:
+            actions (list): a list of specific actions, or an array of their ids
+            out (numpy.array): the buffer of shape (len(actions), 4, 13)
+
+        Returns:
+            (numpy.array): the planes, out if given
+        '''
+        return self._CARD_TABLES.encode_planes(actions, out)
+
+    def get_legal_action_mask(self, legal_actions, dtype=bool):
+        ''' Mask of the legal actions over the dense index of all specific actions
+
+        Args:
+            legal_actions (numpy.array): the action ids, state['legal_actions'] in 'action_ids' mode
+            dtype (numpy.dtype): the dtype of the mask
+
+        Returns:
+            (numpy.array): 1-d mask of length len(CARD_TABLES)
+        '''
+        mask = np.zeros(len(self._CARD_TABLES), dtype=dtype)
+        mask[legal_actions] = 1
+        return mask
+
     def get_summary(self):
 
         from pdkutils import visual_cards
@@ -2,12 +2,13 @@
 ''' Implement Paodekuai Game class
 '''
 
-import functools
+import hashlib
 from heapq import merge
 import numpy as np
 
 from pdkutils import get_downstream_player_id, get_upstream_player_id
-from pdkutils import cards2str, paodekuai_sort_card, ACTION_LIST
+from pdkutils import CARD_RANK_STR_INDEX, ACTION_LIST, cards2str
+from pdkmovegen import str2code
 from pdkplayer import PaodekuaiPlayer as Player
 from pdkround import PaodekuaiRound as Round
 from pdkjudger import PaodekuaiJudger as Judger
@@ -37,6 +38,8 @@ class PaodekuaiGame(object):
         self.allow_step_back = allow_step_back
         self.np_random = np.random.RandomState()
         self.num_players = 3
+        # step_back stops at the length of the trace when the game was imported
+        self._step_back_floor = 0
 
     def init_game(self):
         ''' Initialize players and state.
@@ -48,6 +51,7 @@ class PaodekuaiGame(object):
         # initialize public variables
         self.winner_id = None
         self.history = []
+        self._step_back_floor = 0
 
         # initialize players
         self.players = [Player(num, self.np_random)
@@ -112,7 +116,7 @@ class PaodekuaiGame(object):
         Returns:
             (bool): True if the game steps back successfully
         '''
-        if not self.round.trace:
+        if len(self.round.trace) <= self._step_back_floor:
             return False
 
         #winner_id will be always None no matter step_back from any case
@@ -125,6 +129,7 @@ class PaodekuaiGame(object):
         if (cards != 'pass'):
             self.players[player_id].played_cards = self.round.find_last_played_cards_in_trace(player_id)
         self.players[player_id].play_back()
+        self.round.public['remain_{}'.format(player_id)] = len(self.players[player_id].current_hand)
 
         #reverse judger.played_cards if needed
         if (cards != 'pass'):
@@ -133,6 +138,70 @@ class PaodekuaiGame(object):
         self.state = self.get_state(self.round.current_player)
         return True
 
+    def export_state(self):
+        ''' Export the state of the game, see GameSnapshot
+
+        Returns:
+            (GameSnapshot): the immutable state of the game
+        '''
+        return GameSnapshot(
+            hands=tuple(tuple(player.current_hand) for player in self.players),
+            initial_hands=tuple(player.initial_hand for player in self.players),
+            played=tuple(player.played_cards for player in self.players),
+            trace=tuple(self.round.trace),
+            played_cards=self.round.played_cards,
+            current_player=self.round.current_player,
+            greater_player=None if self.round.greater_player is None else self.round.greater_player.player_id,
+            winner_id=self.winner_id)
+
+    def import_state(self, snapshot):
+        ''' Set the game to an exported state
+
+        The game can step back to the imported state but not beyond it, as
+        the snapshot does not keep the history of the hands.
+
+        Args:
+            snapshot (GameSnapshot): the state to set
+
+        Returns:
+            dict: the state of the current player
+            int: current player's id
+        '''
+        self.winner_id = snapshot.winner_id
+        self.history = []
+        self._step_back_floor = len(snapshot.trace)
+
+        self.players = [Player(num, self.np_random) for num in range(self.num_players)]
+        for player, hand, initial_hand, played in zip(self.players, snapshot.hands,
+                                                      snapshot.initial_hands, snapshot.played):
+            player.set_current_hand(list(hand))
+            player.initial_hand = initial_hand
+            player.played_cards = played
+
+        self.round = Round(self.np_random)
+        self.round.trace = list(snapshot.trace)
+        self.round.played_cards = snapshot.played_cards
+        self.round.current_player = snapshot.current_player
+        if snapshot.greater_player is not None:
+            self.round.greater_player = self.players[snapshot.greater_player]
+        remains = {'remain_{}'.format(player.player_id): len(player.current_hand) for player in self.players}
+        self.round.public = {'deck': self.round.deck_str, 'trace': self.round.trace,
+                             'played_cards': self.round.played_cards, **remains}
+
+        # the playable cards only depend on the hands
+        self.judger = Judger(self.players, self.np_random)
+
+        self.state = self.get_state(self.round.current_player)
+        return self.state, self.round.current_player
+
+    def clone(self):
+        ''' Copy the game through a snapshot
+
+        Returns:
+            (PaodekuaiGame): a new game in the same state, without its history
+        '''
+        return self.export_state().clone(self.allow_step_back)
+
     def get_state(self, player_id):
         ''' Return player's state
 
@@ -191,8 +260,102 @@ class PaodekuaiGame(object):
         player_up = self.players[get_upstream_player_id(player, self.players)]
         player_down = self.players[get_downstream_player_id(
             player, self.players)]
-        others_hand = merge(player_up.current_hand, player_down.current_hand, key=functools.cmp_to_key(paodekuai_sort_card))
-        return cards2str(others_hand)
+        others_hand = merge(player_up.current_hand_str, player_down.current_hand_str, key=CARD_RANK_STR_INDEX.__getitem__)
+        return ''.join(others_hand)
+
+class GameSnapshot(object):
+    ''' Immutable state of a PaodekuaiGame, see PaodekuaiGame.export_state
+
+    Every field is a tuple, a str or an int, so copying a snapshot is O(1) and
+    exporting it is O(hand size + trace).
+
+    Attributes:
+        hands (tuple): the cards of every player, as indexes in pdkutils.DECK_48
+        codes (tuple): the hands as packed rank counts, see pdkmovegen.counts2code
+        initial_hands (tuple): the initial hand of every player, e.g. '3445TTA...'
+        played (tuple): the last cards played by every player, or None
+        trace (tuple): the (player_id, action) of every move
+        played_cards (str): all the played cards, sorted
+        current_player (int): the player to act
+        greater_player (int): the player who played the current biggest cards, or None
+        winner_id (int): the winner, or None
+    '''
+    __slots__ = ('hands', 'codes', 'initial_hands', 'played', 'trace', 'played_cards',
+                 'current_player', 'greater_player', 'winner_id', '_key', '_hash')
+
+    def __init__(self, hands, initial_hands, played, trace, played_cards,
+                 current_player, greater_player, winner_id):
+        # the agents may play numpy strings and ints, keep the builtin types so
+        # that the equality, the hash and the repr only depend on the values
+        trace = tuple((int(player), str(action)) for player, action in trace)
+        current_player = int(current_player)
+        greater_player = None if greater_player is None else int(greater_player)
+        winner_id = None if winner_id is None else int(winner_id)
+        setter = object.__setattr__
+        setter(self, 'hands', hands)
+        setter(self, 'codes', tuple(str2code(cards2str(hand)) for hand in hands))
+        setter(self, 'initial_hands', initial_hands)
+        setter(self, 'played', played)
+        setter(self, 'trace', trace)
+        setter(self, 'played_cards', played_cards)
+        setter(self, 'current_player', current_player)
+        setter(self, 'greater_player', greater_player)
+        setter(self, 'winner_id', winner_id)
+        # suits do not change the game, so they are left out of the comparisons
+        setter(self, '_key', (self.codes, trace, current_player, greater_player, winner_id))
+        setter(self, '_hash', None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('GameSnapshot is immutable')
+
+    def __eq__(self, other):
+        if isinstance(other, GameSnapshot):
+            return self._key == other._key
+        return NotImplemented
+
+    def __hash__(self):
+        return self.stable_hash()
+
+    def stable_hash(self):
+        ''' A 64-bit hash of the state, the same in every process and run
+
+        Returns:
+            int: the hash of the hands as rank counts, the trace and the players
+        '''
+        if self._hash is None:
+            digest = hashlib.blake2b(repr(self._key).encode('ascii'), digest_size=8).digest()
+            object.__setattr__(self, '_hash', int.from_bytes(digest, 'little'))
+        return self._hash
+
+    def __reduce__(self):
+        return (GameSnapshot, (self.hands, self.initial_hands, self.played, self.trace,
+                               self.played_cards, self.current_player, self.greater_player, self.winner_id))
+
+    def clone(self, allow_step_back=False):
+        ''' Create a new game in this state
+
+        Args:
+            allow_step_back (boolean): allow_step_back of the new game
+
+        Returns:
+            (PaodekuaiGame): the new game
+        '''
+        game = PaodekuaiGame(allow_step_back)
+        game.import_state(self)
+        return game
+
+    def restore(self, game):
+        ''' Set game to this state, see PaodekuaiGame.import_state
+
+        Args:
+            game (PaodekuaiGame): the game to set
+
+        Returns:
+            dict: the state of the current player
+            int: current player's id
+        '''
+        return game.import_state(self)
+
 
 # if __name__ == '__main__':
 #
@@ -5,20 +5,9 @@ import numpy as np
 import collections
 from itertools import combinations
 from bisect import bisect_left
-from rules import sort_card_rank
 from pdkutils import CARD_RANK_STR, CARD_RANK_STR_INDEX, ACTION_LIST
-from pdkutils import cards2str, contains_cards
-
-
-def sort_card(cards):
-    card_order = '3456789TJQKA2'
-    res = ''
-    candid = list(cards)
-    for card in card_order:
-        while card in candid:
-            res += card
-            candid.remove(card)
-    return res
+from pdkutils import contains_cards, sort_card
+from pdkmovegen import initial_playable_moves, str2code, hand2counts, unfit_moves, has_trio, hand_is_finishing
 
 
 FIXED_LIST = []
@@ -34,16 +23,7 @@ class PaodekuaiJudger(object):
     """ Determine what cards a player can play
     """
 
-    @staticmethod
-    def sort_card(cards):
-        card_order = '3456789TJQKA2'
-        res = ''
-        candid = list(cards)
-        for card in card_order:
-            while card in candid:
-                res += card
-                candid.remove(card)
-        return res
+    sort_card = staticmethod(sort_card)
 
     @staticmethod
     def chain_indexes(indexes_list):
@@ -160,6 +140,10 @@ class PaodekuaiJudger(object):
 
         Returns:
             set: set of string of playable cards
+
+        Note:
+            This is the string based reference, the game uses the count-vector
+            generator in pdkmovegen which gives the same set.
         """
         cards_dict = collections.defaultdict(int)
         for card in current_hand:
@@ -191,7 +175,7 @@ class PaodekuaiJudger(object):
                 new = 'AAA'
                 for rank in other:
                     new += rank
-                playable_cards.add(sort_card_rank(new))
+                playable_cards.add(sort_card(new))
 
         # solo_chain_5 -- #solo_chain_12 start_index is idx in CARD_RANK_STR, gets rank
         solo_chain_indexes = PaodekuaiJudger.chain_indexes(non_zero_indexes)
@@ -307,7 +291,7 @@ class PaodekuaiJudger(object):
                 new = CARD_RANK_STR[i[0]]*4
                 for rank in other:
                     new += rank
-                playable_cards.add(sort_card_rank(new))
+                playable_cards.add(sort_card(new))
 
         return playable_cards
 
@@ -315,70 +299,62 @@ class PaodekuaiJudger(object):
         ''' Initilize the Judger class for Dou Dizhu
         '''
         self.playable_cards = [set() for _ in range(3)]
+        # the integer code of every playable cards, see pdkmovegen
+        self._playable_codes = [{} for _ in range(3)]
         self._recorded_removed_playable_cards = [[] for _ in range(3)]
+        self._recorded_added_playable_cards = [[] for _ in range(3)]
         for player in players:
             player_id = player.player_id
-            current_hand = cards2str(player.current_hand)
+            current_hand = player.current_hand_str
             # according to the game rule, generate all legal actions without comparison
             # the true legal actions are given directly by 'get_gt_cards' in pdkutils
-            self.playable_cards[player_id] = self.playable_cards_from_hand(current_hand)
+            moves = initial_playable_moves(current_hand)
+            self.playable_cards[player_id] = set(moves)
+            self._playable_codes[player_id] = dict(moves)
 
     def calc_playable_cards(self, player):
-        """ Recalculate all legal cards the player can play according to his
-        current hand.
+        """ Update all legal cards the player can play according to his
+        current hand, after he played some cards.
+
+        The playable cards of the hand before the play are checked against
+        the hand with one bit test each, see pdkmovegen.unfit_moves, and the
+        only cards which can become playable is the hand itself, see
+        pdkmovegen.hand_is_finishing. So the playable cards are updated in
+        place instead of being generated again. The check runs over all the
+        playable cards left: they shrink fast, to about 20 in an average
+        update, and indexing them by rank costs more than it saves.
 
         Args:
             player (PaodekuaiPlayer object): object of PaodekuaiPlayer
-            init_flag (boolean): For the first time, set it True to accelerate
-              the preocess.
 
         Returns:
-            list: list of string of playable cards
+            set: set of string of playable cards
         """
-
         player_id = player.player_id
-        # old playable cards
-        playable_cards = self.playable_cards[player_id].copy()
+        playable_cards = self.playable_cards[player_id]
+        playable_codes = self._playable_codes[player_id]
 
         # this current_hand is updated after action ,so it's different from old_playable_cards
-        current_hand = cards2str(player.current_hand)
+        current_hand = player.current_hand_str
+        hand_code = str2code(current_hand)
+
+        removed_playable_cards = unfit_moves(playable_codes, hand_code)
+        for cards in removed_playable_cards:
+            del playable_codes[cards]
+        playable_cards.difference_update(removed_playable_cards)
+
+        added_playable_cards = []
+        # a finishing hand holds a trio at least
+        if has_trio(hand_code) and current_hand not in playable_codes \
+                and hand_is_finishing(hand2counts(current_hand)):
+            added_playable_cards.append(current_hand)
+            playable_codes[current_hand] = hand_code
+            playable_cards.add(current_hand)
 
-        current_legal = self.playable_cards_from_hand(current_hand)
-        removed_playable_cards = list(playable_cards.difference(current_legal))
-        self.playable_cards[player_id] = current_legal
         self._recorded_removed_playable_cards[player_id].append(removed_playable_cards)
+        self._recorded_added_playable_cards[player_id].append(added_playable_cards)
 
-        return self.playable_cards[player_id]
-
-        # player_id = player.player_id
-        # removed_playable_cards = []
-        # missed = None
-        # for single in player.singles:
-        #     if single not in current_hand:
-        #         missed = single
-        #         break
-        #
-        # playable_cards = self.playable_cards[player_id].copy()
-        # print("before:")
-        # print(playable_cards)
-        # if missed is not None:
-        #     position = player.singles.find(missed)
-        #     player.singles = player.singles[position + 1:]
-        #     for cards in playable_cards:
-        #         if missed in cards or (not contains_cards(current_hand, cards)):
-        #             removed_playable_cards.append(cards)
-        #             self.playable_cards[player_id].remove(cards)
-        # else:
-        #     for cards in playable_cards:
-        #         if not contains_cards(current_hand, cards):
-        #             # del self.playable_cards[player_id][cards]
-        #             removed_playable_cards.append(cards)
-        #             self.playable_cards[player_id].remove(cards)
-        # self._recorded_removed_playable_cards[player_id].append(removed_playable_cards)
-        # print('removed:')
-        # print(self._recorded_removed_playable_cards[player_id])
-        # print(self.playable_cards[player_id])
-        # return self.playable_cards[player_id]
+        return playable_cards
 
     def restore_playable_cards(self, player_id):
         ''' restore playable_cards for judger for game.step_back().
@@ -387,6 +363,12 @@ class PaodekuaiJudger(object):
             player_id: The id of the player whose playable_cards need to be restored
         '''
         removed_playable_cards = self._recorded_removed_playable_cards[player_id].pop()
+        added_playable_cards = self._recorded_added_playable_cards[player_id].pop()
+        for cards in added_playable_cards:
+            del self._playable_codes[player_id][cards]
+        self.playable_cards[player_id].difference_update(added_playable_cards)
+        for cards in removed_playable_cards:
+            self._playable_codes[player_id][cards] = str2code(cards)
         self.playable_cards[player_id].update(removed_playable_cards)
 
     def get_playable_cards(self, player):
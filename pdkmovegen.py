@@ -0,0 +1,645 @@
+# -*- coding: utf-8 -*-
+''' Count-vector move generator for Paodekuai
+
+A hand is a 13-slot vector of rank counts ordered as CARD_RANK_STR, or the
+same vector packed into a 52-bit integer with 4 bits per rank. Moves come
+back as packed integers in the same layout, so a move code is simply the
+rank counts it uses and `hand_code - move_code` is the hand left behind.
+
+The legal set is exactly the one of PaodekuaiJudger.playable_cards_from_hand,
+`playable_cards_from_hand` below is the string adapter used by the game.
+`gt_cards_from_hand` answers a target directly, building only the moves of
+the target's types which beat it, plus bombs.
+'''
+import os
+import threading
+import numpy as np
+from itertools import combinations
+from collections import OrderedDict
+from pdkutils import ROOT_PATH, CARD_RANK_STR, CARD_RANK_STR_INDEX, CARD_TYPE
+
+NUM_RANKS = len(CARD_RANK_STR)
+RANK_BITS = 4
+RANK_MASK = (1 << RANK_BITS) - 1
+# packed code of a single card of each rank
+UNIT = [1 << (RANK_BITS * rank) for rank in range(NUM_RANKS)]
+CARD_UNIT = {card: UNIT[idx] for card, idx in CARD_RANK_STR_INDEX.items()}
+TWO = CARD_RANK_STR_INDEX['2']  # '2' never joins a chain
+ACE = CARD_RANK_STR_INDEX['A']
+
+# the high bit of every rank, see code_fits
+_HIGH_BITS = sum(8 << (RANK_BITS * rank) for rank in range(NUM_RANKS))
+# 5 in every rank, see has_trio
+_FIVES = sum(5 << (RANK_BITS * rank) for rank in range(NUM_RANKS))
+
+# the default number of hands kept by MOVE_CACHE
+DEFAULT_CACHE_SIZE = 8192
+
+# files of the opening-hand move table, written by rules.create_opening_table
+OPENING_TABLE_FILES = {'keys': 'pdk_opening_keys.bin',
+                       'offsets': 'pdk_opening_offsets.bin',
+                       'moves': 'pdk_opening_moves.bin',
+                       'text_offsets': 'pdk_opening_text_offsets.bin',
+                       'text': 'pdk_opening_text.bin'}
+
+# decode tables, every table turns the counts of two ranks into a string
+_DECODE_RANKS = 2
+_DECODE_BITS = RANK_BITS * _DECODE_RANKS
+_DECODE_MASK = (1 << _DECODE_BITS) - 1
+_DECODE_TABLES = []
+for _start in range(0, NUM_RANKS, _DECODE_RANKS):
+    _ranks = CARD_RANK_STR[_start:_start + _DECODE_RANKS]
+    _DECODE_TABLES.append(tuple(''.join(rank * ((bits >> (RANK_BITS * k)) & RANK_MASK)
+                                        for k, rank in enumerate(_ranks))
+                                for bits in range(1 << (RANK_BITS * len(_ranks)))))
+
+
+def hand2counts(cards):
+    ''' Get the rank-count vector of cards
+
+    Args:
+        cards (str): string of cards, e.g. '33345'
+
+    Returns:
+        list: 13 counts ordered as CARD_RANK_STR
+    '''
+    return [cards.count(rank) for rank in CARD_RANK_STR]
+
+
+def counts2code(counts):
+    ''' Pack a rank-count vector into an integer code
+    '''
+    code = 0
+    for rank, count in enumerate(counts):
+        code |= count << (RANK_BITS * rank)
+    return code
+
+
+def code2counts(code):
+    ''' Unpack an integer code into a rank-count vector
+    '''
+    return [(code >> (RANK_BITS * rank)) & RANK_MASK for rank in range(NUM_RANKS)]
+
+
+def str2code(cards):
+    ''' Get the integer code of cards, e.g. '33345' -> 0x11103
+    '''
+    code = 0
+    for card in cards:
+        code += CARD_UNIT[card]
+    return code
+
+
+def code2str(code):
+    ''' Get the sorted string of cards of an integer code, e.g. 0x11103 -> '33345'
+    '''
+    res = ''
+    for table in _DECODE_TABLES:
+        res += table[code & _DECODE_MASK]
+        code >>= _DECODE_BITS
+    return res
+
+
+def _hand_units(counts):
+    ''' One unit per card of the hand, ordered by rank
+    '''
+    units = []
+    for rank, count in enumerate(counts):
+        if count:
+            units += [UNIT[rank]] * count
+    return units
+
+
+def _attachment_units(counts, chain_start, chain_length):
+    ''' Cards which may be attached to a trio or a trio chain, see
+    PaodekuaiJudger.solo_attachments
+
+    Args:
+        counts (list): rank counts of the hand
+        chain_start (int): the rank index of the start of the trio (chain)
+        chain_length (int): the number of trios in the chain
+
+    Returns:
+        list: one unit per candidate card, ordered by rank
+    '''
+    chain_end = chain_start + chain_length
+    units = []
+    for rank, count in enumerate(counts):
+        if not count or chain_start <= rank < chain_end:
+            continue
+        # attachments can not have bomb, nor 3 same cards consecutive with the trio (except '222')
+        limit = 2 if (rank == chain_start - 1 or rank == chain_end) and rank != TWO else 3
+        units += [UNIT[rank]] * (count if count < limit else limit)
+    return units
+
+
+def _runs(counts, least):
+    ''' Maximal runs of consecutive ranks (without '2') with at least `least` cards
+
+    Returns:
+        list of tuples: [(start_index, length), ...], with length > 1
+    '''
+    runs = []
+    start = None
+    for rank in range(TWO + 1):
+        if rank < TWO and counts[rank] >= least:
+            if start is None:
+                start = rank
+        elif start is not None:
+            if rank - start > 1:
+                runs.append((start, rank - start))
+            start = None
+    return runs
+
+
+def _add_singles(counts, playable):
+    ''' solo, pair and bomb
+    '''
+    add = playable.add
+    for rank, count in enumerate(counts):
+        if count:
+            unit = UNIT[rank]
+            # solo
+            add(unit)
+            # pair
+            if count > 1:
+                add(2 * unit)
+            # bomb
+            if count > 3:
+                add(4 * unit)
+
+
+def _add_ace_trio(counts, playable):
+    ''' 'AAA' and 'AAA' with 3 attachments
+    '''
+    if counts[ACE] >= 3:
+        main = 3 * UNIT[ACE]
+        playable.add(main)
+        rest = list(counts)
+        rest[ACE] -= 3
+        playable.update(map(main.__add__, map(sum, combinations(_hand_units(rest), 3))))
+
+
+def _add_solo_chains(counts, playable):
+    ''' solo_chain_5 -- solo_chain_12
+    '''
+    for start, length in _runs(counts, 1):
+        for s in range(start, start + length - 4):
+            cards = sum(UNIT[s:s + 4])
+            for e in range(s + 4, min(start + length, s + 12)):
+                cards += UNIT[e]
+                playable.add(cards)
+
+
+def _add_pair_chains(counts, playable):
+    ''' pair_chain_2 -- pair_chain_8
+    '''
+    for start, length in _runs(counts, 2):
+        for s in range(start, start + length - 1):
+            cards = 2 * UNIT[s]
+            for e in range(s + 1, min(start + length, s + 8)):
+                cards += 2 * UNIT[e]
+                playable.add(cards)
+
+
+def _add_trios(counts, hands_count, playable, ranks=range(NUM_RANKS)):
+    ''' trio, trio_solo, only when the player can finish it, and trio + solo*2
+    '''
+    add = playable.add
+    for rank in ranks:
+        if counts[rank] < 3:
+            continue
+        main = 3 * UNIT[rank]
+        if hands_count == 3:
+            add(main)
+        if hands_count == 4:
+            for other, other_count in enumerate(counts):
+                if other_count and other != rank:
+                    add(main + UNIT[other])
+        playable.update(map(main.__add__, map(sum, combinations(_attachment_units(counts, rank, 1), 2))))
+
+
+def _add_planes(counts, hand_code, hands_count, playable):
+    ''' plane_chain, with or without attachments
+    '''
+    add = playable.add
+    for start, length in _runs(counts, 3):
+        # if you can finish it
+        if length * 5 >= hands_count:
+            add(hand_code)
+        for s in range(start, start + length - 1):
+            main = 3 * UNIT[s]
+            for e in range(s + 1, min(start + length, s + 5)):
+                main += 3 * UNIT[e]
+                chain_length = e - s + 1
+                # trio_chain_2 to trio_chain_5, only when the player can finish it
+                if hands_count == 3 * chain_length:
+                    add(main)
+                if chain_length > 4:
+                    continue
+                units = _attachment_units(counts, s, chain_length)
+                # trio_solo_chain_2 to trio_solo_chain_4, only when the player can finish it
+                if hands_count == 4 * chain_length:
+                    playable.update(map(main.__add__, map(sum, combinations(units, chain_length))))
+                # trio_2*solo_chain_2 to trio_2*solo_chain_4
+                playable.update(map(main.__add__, map(sum, combinations(units, 2 * chain_length))))
+
+
+def _add_bomb_chains(counts, hand_code, hands_count, playable):
+    ''' bomb_solo_chain
+    '''
+    for rank, count in enumerate(counts):
+        if count < 4:
+            continue
+        if hands_count <= 7:
+            playable.add(hand_code)
+        main = 4 * UNIT[rank]
+        rest = list(counts)
+        rest[rank] = 0
+        playable.update(map(main.__add__, map(sum, combinations(_hand_units(rest), 3))))
+
+
+def playable_codes_from_counts(counts):
+    ''' Get playable moves from a rank-count vector
+
+    Args:
+        counts (list): 13 rank counts ordered as CARD_RANK_STR
+
+    Returns:
+        set: set of integer codes of playable cards
+    '''
+    hand_code = counts2code(counts)
+    hands_count = sum(counts)
+    playable = set()
+    _add_singles(counts, playable)
+    _add_ace_trio(counts, playable)
+    _add_solo_chains(counts, playable)
+    _add_pair_chains(counts, playable)
+    _add_trios(counts, hands_count, playable)
+    _add_planes(counts, hand_code, hands_count, playable)
+    _add_bomb_chains(counts, hand_code, hands_count, playable)
+    return playable
+
+
+def _filter_type(candidates, card_type, weight):
+    ''' Keep the candidates which are of card_type with a weight larger than weight
+
+    Returns:
+        list of tuples: [(weight, code), ...]
+    '''
+    res = []
+    for code in candidates:
+        best = -1
+        for can_type, can_weight in CARD_TYPE[0].get(code2str(code), ()):
+            if can_type == card_type and int(can_weight) > best:
+                best = int(can_weight)
+        if best > weight:
+            res.append((best, code))
+    return res
+
+
+def _responses(counts, card_type, weight):
+    ''' Get playable cards of card_type which beat the given weight
+
+    Args:
+        counts (list): rank counts of the hand
+        card_type (str): a type in TYPE_CARD, e.g. 'plane_chain_1'
+        weight (int): the weight of the target cards in card_type
+
+    Returns:
+        list of tuples: [(weight, code), ...]
+    '''
+    if card_type == 'solo':
+        return [(rank, UNIT[rank]) for rank in range(weight + 1, NUM_RANKS) if counts[rank]]
+    if card_type == 'pair':
+        return [(rank, 2 * UNIT[rank]) for rank in range(weight + 1, TWO) if counts[rank] > 1]
+    if card_type == 'bomb':
+        res = [(rank, 4 * UNIT[rank]) for rank in range(weight + 1, ACE) if counts[rank] > 3]
+        if weight < ACE and counts[ACE] >= 3:
+            res.append((ACE, 3 * UNIT[ACE]))
+        return res
+    if card_type.startswith('solo_chain_') or card_type.startswith('pair_chain_'):
+        size = 1 if card_type.startswith('solo') else 2
+        chain_length = int(card_type.rsplit('_', 1)[1])
+        res = []
+        for start, length in _runs(counts, size):
+            for s in range(max(start, weight + 1), start + length - chain_length + 1):
+                res.append((s, size * sum(UNIT[s:s + chain_length])))
+        return res
+
+    # moves with attachments may be of several types, generate the candidates and check them
+    hand_code = counts2code(counts)
+    hands_count = sum(counts)
+    candidates = set()
+    if card_type == 'plane_chain_1':
+        _add_trios(counts, hands_count, candidates)
+        # a 5-card bomb with attachment is only playable to finish the hand
+        if hands_count <= 5:
+            _add_bomb_chains(counts, hand_code, hands_count, candidates)
+    elif card_type.startswith('plane_chain_'):
+        _add_planes(counts, hand_code, hands_count, candidates)
+        _add_ace_trio(counts, candidates)
+        _add_bomb_chains(counts, hand_code, hands_count, candidates)
+    elif card_type == 'bomb_solo_chain':
+        _add_bomb_chains(counts, hand_code, hands_count, candidates)
+        _add_ace_trio(counts, candidates)
+        _add_trios(counts, hands_count, candidates, ranks=(ACE,))
+        if hands_count <= 7:
+            _add_planes(counts, hand_code, hands_count, candidates)
+    else:
+        candidates = playable_codes_from_counts(counts)
+    return _filter_type(candidates, card_type, weight)
+
+
+def gt_cards_from_hand(current_hand, target_cards):
+    ''' Get the playable cards which are greater than target_cards, without
+    generating the full playable set
+
+    Args:
+        current_hand (str): string of the hand
+        target_cards (str): the cards to beat, must be legal cards in the game
+
+    Returns:
+        list: list of string of greater cards, ordered by type, weight and
+        code, or ['pass'] if there are no greater cards
+    '''
+    counts = hand2counts(current_hand)
+    type_dict = {}  # type_dict stores the target types which the player is trying to beat with
+    # if cards can be multiply explained, choose the largest one
+    for card_type, weight in CARD_TYPE[0][target_cards]:
+        weight = int(weight)
+        if card_type not in type_dict or type_dict[card_type] < weight:
+            type_dict[card_type] = weight
+    if 'bomb' not in type_dict:
+        type_dict['bomb'] = -1
+
+    gt_cards = []
+    seen = set()
+    for card_type, weight in type_dict.items():
+        for _, code in sorted(_responses(counts, card_type, weight)):
+            if code not in seen:
+                seen.add(code)
+                gt_cards.append(code2str(code))
+    # add 'pass' to legal actions, if no bigger cards
+    if not gt_cards:
+        gt_cards.append('pass')
+    return gt_cards
+
+
+def code_fits(code, hand_code):
+    ''' Whether the cards of code are contained in hand_code
+
+    Every rank count is below 8, so subtracting code from hand_code with the
+    high bit of every rank set borrows that bit iff the rank does not fit.
+    '''
+    return ((hand_code | _HIGH_BITS) - code) & _HIGH_BITS == _HIGH_BITS
+
+
+def unfit_moves(moves, hand_code):
+    ''' Get the moves which do not fit into the hand any more, code_fits over all the moves
+
+    Args:
+        moves (dict): string of cards -> integer code
+        hand_code (int): the packed hand
+
+    Returns:
+        list: the strings of the moves which do not fit
+    '''
+    high = hand_code | _HIGH_BITS
+    return [cards for cards, code in moves.items() if (high - code) & _HIGH_BITS != _HIGH_BITS]
+
+
+def has_trio(code):
+    ''' Whether a rank of code counts 3 cards or more
+
+    Every rank count is below 5, so adding 5 to it sets its high bit iff it is 3 or more.
+    '''
+    return (code + _FIVES) & _HIGH_BITS != 0
+
+
+def hand_is_finishing(counts):
+    ''' Whether the whole hand is playable because it empties the hand: a
+    trio, a trio with solo, a plane (with attachments) or a bomb with fewer
+    attachments than usual. These are the only moves which appear when the
+    hand shrinks, every other move of a hand is also a move of a larger hand.
+
+    Args:
+        counts (list): 13 rank counts ordered as CARD_RANK_STR
+
+    Returns:
+        boolean
+    '''
+    hands_count = sum(counts)
+    if hands_count == 3:
+        return max(counts) >= 3
+    if hands_count == 4 and 3 in counts:
+        return True
+    if hands_count <= 7 and max(counts) >= 4:
+        return True
+    for _, length in _runs(counts, 3):
+        if length * 5 >= hands_count:
+            return True
+    return False
+
+
+def playable_codes_from_hand(current_hand):
+    ''' Get playable moves from a packed hand code
+
+    Args:
+        current_hand (int): packed hand, see counts2code
+
+    Returns:
+        set: set of integer codes of playable cards
+    '''
+    return playable_codes_from_counts(code2counts(current_hand))
+
+
+class MoveCache(object):
+    ''' Process-wide LRU cache of playable cards keyed by the hand multiset
+
+    The key is the packed code of the hand, so '3345' and '5433' share one
+    entry. Cached values are shared between callers and must not be modified.
+    '''
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE, enabled=True):
+        ''' Initialize the cache
+
+        Args:
+            maxsize (int): the maximal number of cached hands
+            enabled (boolean): False to always regenerate the moves
+        '''
+        self.maxsize = maxsize
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._moves = OrderedDict()
+        self._lock = threading.Lock()
+
+    def playable_moves(self, current_hand):
+        ''' Get playable cards from hand with their codes, see playable_codes_from_counts
+
+        Args:
+            current_hand (str): string of the hand
+
+        Returns:
+            dict: string of playable cards -> integer code, shared and must not be modified
+        '''
+        key = str2code(current_hand)
+        if self.enabled:
+            with self._lock:
+                moves = self._moves.get(key)
+                if moves is not None:
+                    self.hits += 1
+                    self._moves.move_to_end(key)
+                    return moves
+                self.misses += 1
+        moves = {code2str(code): code for code in playable_codes_from_counts(code2counts(key))}
+        if self.enabled:
+            with self._lock:
+                self._moves[key] = moves
+                while len(self._moves) > self.maxsize:
+                    self._moves.popitem(last=False)
+        return moves
+
+    def playable_cards(self, current_hand):
+        ''' Get playable cards from hand
+
+        Args:
+            current_hand (str): string of the hand
+
+        Returns:
+            set-like: read-only view of the string of playable cards
+        '''
+        return self.playable_moves(current_hand).keys()
+
+    def configure(self, maxsize=None, enabled=None):
+        ''' Change the size limit or switch the cache on/off, a disabled cache is emptied
+        '''
+        with self._lock:
+            if maxsize is not None:
+                self.maxsize = maxsize
+            if enabled is not None:
+                self.enabled = enabled
+            if not self.enabled:
+                self._moves.clear()
+            while len(self._moves) > self.maxsize:
+                self._moves.popitem(last=False)
+
+    def clear(self):
+        ''' Drop all cached hands and reset the counters
+        '''
+        with self._lock:
+            self._moves.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        ''' Get the statistics of the cache
+
+        Returns:
+            dict: hits, misses, hit_rate, size, maxsize and enabled
+        '''
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.,
+                'size': len(self._moves), 'maxsize': self.maxsize, 'enabled': self.enabled}
+
+
+MOVE_CACHE = MoveCache()
+
+
+def playable_cards_from_hand(current_hand):
+    ''' String adapter of playable_codes_from_counts, a drop-in replacement of
+    PaodekuaiJudger.playable_cards_from_hand. Served from MOVE_CACHE.
+
+    Args:
+        current_hand (str): sorted string of the hand
+
+    Returns:
+        set: set of string of playable cards, owned by the caller
+    '''
+    return set(MOVE_CACHE.playable_cards(current_hand))
+
+
+class OpeningTable(object):
+    ''' Precomputed moves of opening hands, memory-mapped read-only
+
+    The table is a set of flat files: the sorted hand codes, the sorted move
+    codes of all hands one after another, the same moves as space separated
+    ASCII strings, and the offsets of every hand in the moves and in the text
+    (one more than the hands). Numbers are little-endian uint64. Reading the
+    strings saves decoding every code, and mapped pages are shared by every
+    process which loads the same files.
+    '''
+
+    def __init__(self, path=None):
+        ''' Initialize the table, the files are mapped on the first lookup
+
+        Args:
+            path (str): the directory of the table files, jsondata by default
+        '''
+        self.path = os.path.join(ROOT_PATH, 'jsondata') if path is None else path
+        self.hits = 0
+        self.misses = 0
+        self._arrays = None
+
+    def load(self):
+        ''' Map the table files
+
+        Returns:
+            boolean: False if the table has not been built
+        '''
+        if self._arrays is None:
+            files = {name: os.path.join(self.path, file) for name, file in OPENING_TABLE_FILES.items()}
+            if not all(os.path.exists(file) for file in files.values()):
+                self._arrays = {}
+            else:
+                self._arrays = {name: np.memmap(file, dtype=np.uint8 if name == 'text' else '<u8', mode='r')
+                                for name, file in files.items()}
+        return bool(self._arrays)
+
+    def playable_moves(self, current_hand):
+        ''' Look up the playable cards of a hand
+
+        Args:
+            current_hand (str): string of the hand
+
+        Returns:
+            dict: string of playable cards -> integer code, None if the hand is not in the table
+        '''
+        if not self.load():
+            return None
+        key = str2code(current_hand)
+        keys = self._arrays['keys']
+        idx = int(np.searchsorted(keys, np.uint64(key)))
+        if idx == len(keys) or int(keys[idx]) != key:
+            self.misses += 1
+            return None
+        self.hits += 1
+        offsets = self._arrays['offsets']
+        codes = self._arrays['moves'][int(offsets[idx]):int(offsets[idx + 1])].tolist()
+        offsets = self._arrays['text_offsets']
+        text = self._arrays['text'][int(offsets[idx]):int(offsets[idx + 1])].tobytes().decode('ascii')
+        return dict(zip(text.split(' '), codes))
+
+    def __len__(self):
+        return len(self._arrays['keys']) if self.load() else 0
+
+
+OPENING_TABLE = OpeningTable()
+
+
+def initial_playable_moves(current_hand):
+    ''' Get playable cards of a dealt hand, from OPENING_TABLE if it has been
+    built, otherwise from MOVE_CACHE
+
+    Args:
+        current_hand (str): string of the hand
+
+    Returns:
+        dict: string of playable cards -> integer code, must not be modified
+    '''
+    moves = OPENING_TABLE.playable_moves(current_hand)
+    if moves is None:
+        moves = MOVE_CACHE.playable_moves(current_hand)
+    return moves
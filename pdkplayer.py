@@ -2,10 +2,8 @@
 ''' Implement Paodekuai Player class
 '''
 
-import functools
-
 from pdkutils import get_gt_cards
-from pdkutils import cards2str, cards2str_with_suit, paodekuai_sort_card
+from pdkutils import cards2str, cards2str_with_suit, CARD_INDEX_RANK, CARD_INDEX_RANK_ID
 
 
 class PaodekuaiPlayer(object):
@@ -13,6 +11,8 @@ class PaodekuaiPlayer(object):
     determine the actions can be made according to the rules,
     and can perfrom corresponding action
     '''
+    __slots__ = ('np_random', 'player_id', 'initial_hand', '_current_hand', '_current_hand_str',
+                 'role', 'played_cards', 'singles', '_recorded_played_cards')
 
     def __init__(self, player_id, np_random):
         ''' Give the player an id in one game
@@ -24,12 +24,14 @@ class PaodekuaiPlayer(object):
             1. role: A player's temporary role in one game(landlord or peasant)
             2. played_cards: The cards played in one round
             3. hand: Initial cards
-            4. _current_hand: The rest of the cards after playing some of them
+            4. _current_hand: The rest of the cards after playing some of them,
+               as indexes in pdkutils.DECK_48 sorted by rank
         '''
         self.np_random = np_random
         self.player_id = player_id
         self.initial_hand = None
         self._current_hand = []
+        self._current_hand_str = ''
         self.role = ''
         self.played_cards = None
         self.singles = '3456789TJQKA2'
@@ -39,18 +41,24 @@ class PaodekuaiPlayer(object):
         self._recorded_played_cards = []
 
     @property
-    # current_hand gives Card object
+    # current_hand gives card indexes in pdkutils.DECK_48
     def current_hand(self):
         return self._current_hand
 
+    @property
+    # current_hand_str gives the string of the ranks, e.g. '3445TTA'
+    def current_hand_str(self):
+        return self._current_hand_str
+
     def set_current_hand(self, value):
         self._current_hand = value
+        self._current_hand_str = cards2str(value)
 
     def get_state(self, public, others_hands, actions):
 
         state = {**public,
                  'self': self.player_id, 'initial_hand': self.initial_hand,
-                 'current_hand': cards2str(self._current_hand),
+                 'current_hand': self._current_hand_str,
                  'current_suit_hand': cards2str_with_suit(self._current_hand), 'others_hand': others_hands,
                  'actions': actions}
 
@@ -99,18 +107,15 @@ class PaodekuaiPlayer(object):
         else:
             removed_cards = []
             self.played_cards = action
+            hand = self._current_hand
             for play_card in action:
                 # if play_card in trans:
                 #     play_card = trans[play_card]
-                for _, remain_card in enumerate(self._current_hand):
-                    if remain_card.rank != '':
-                        remain_card = remain_card.rank
-                    else:
-                        remain_card = remain_card.suit
-                    if play_card == remain_card:
-                        removed_cards.append(self.current_hand[_])
-                        self._current_hand.remove(self._current_hand[_])
+                for _, remain_card in enumerate(hand):
+                    if CARD_INDEX_RANK[remain_card] == play_card:
+                        removed_cards.append(hand.pop(_))
                         break
+            self._current_hand_str = cards2str(hand)
             self._recorded_played_cards.append(removed_cards)
             return self
 
@@ -119,4 +124,5 @@ class PaodekuaiPlayer(object):
         '''
         removed_cards = self._recorded_played_cards.pop()
         self._current_hand.extend(removed_cards)
-        self._current_hand.sort(key=functools.cmp_to_key(paodekuai_sort_card))
+        self._current_hand.sort(key=CARD_INDEX_RANK_ID.__getitem__)
+        self._current_hand_str = cards2str(self._current_hand)
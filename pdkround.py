@@ -13,6 +13,8 @@ from pdkutils import CARD_RANK_STR, CARD_RANK_STR_INDEX
 class PaodekuaiRound(object):
     ''' Round can call other Classes' functions to keep the game running
     '''
+    __slots__ = ('np_random', 'trace', 'played_cards', 'greater_player', 'dealer', 'deck_str',
+                 'current_player', 'public')
 
     def __init__(self, np_random):
         self.np_random = np_random
@@ -91,7 +93,7 @@ class PaodekuaiRound(object):
         self.current_player = player_id
         if (cards != 'pass'):
             for card in cards:
-                self.played_cards = self.played_cards.replace(card, '')
+                self.played_cards = self.played_cards.replace(card, '', 1)
                 # self.played_cards.remove(card)
                 #self.played_cards[CARD_RANK_STR_INDEX[card]] -= 1
             self.public['played_cards'] = self.played_cards# self.cards_ndarray_to_list(self.played_cards)
@@ -0,0 +1,185 @@
+''' Exact endgame solver for Paodekuai with perfect information
+
+The solver searches the game with all the hands known (double dummy). The
+solving player wins a position if he can win the game whatever the other
+two players play, so the opponents are treated as one coalition and the
+search is a boolean alpha-beta: a node of the solving player is won by its
+first won child, a node of an opponent is lost by its first lost child.
+
+Positions are stored in a transposition table keyed by the packed rank
+counts of the hands (see pdkmovegen), the player to act, the leader and the
+target cards.
+'''
+import time
+
+from pdkutils import classify_actions
+from pdkmovegen import MOVE_CACHE, gt_cards_from_hand, str2code, code2str
+
+
+class SolverBudgetExceeded(Exception):
+    ''' Raised when a search runs out of nodes or time
+    '''
+
+
+class EndgameSolver(object):
+    ''' Double dummy alpha-beta solver over the three hands
+    '''
+
+    def __init__(self, max_nodes=200000, time_limit=None, num_players=3, max_entries=1000000):
+        ''' Initialize the solver
+
+        Args:
+            max_nodes (int): the most nodes to visit in one solve, no limit if None
+            time_limit (float): the most seconds of one solve, no limit if None
+            num_players (int): the number of players
+            max_entries (int): the tables are cleared before a solve once they hold more entries
+        '''
+        self.max_nodes = max_nodes
+        self.time_limit = time_limit
+        self.max_entries = max_entries
+        self.num_players = num_players
+        # (player, hand codes, current, leader, target) -> won
+        self.table = {}
+        # (hand, target) -> ordered legal actions
+        self._moves = {}
+        self.nodes = 0
+        self.seconds = 0.
+        self._deadline = None
+
+    @property
+    def nodes_per_second(self):
+        ''' Nodes per second of the last solve
+        '''
+        return self.nodes / self.seconds if self.seconds else 0.
+
+    def clear(self):
+        ''' Empty the transposition table and the table of the ordered actions
+        '''
+        self.table.clear()
+        self._moves.clear()
+
+    def ordered_actions(self, hand, target):
+        ''' Get the legal actions of hand, the most promising first
+
+        The finishing move comes first, then the actions with the most cards,
+        the weakest of a card type first as given by classify_actions.
+
+        Args:
+            hand (str): the sorted hand
+            target (str): the cards to beat, None for a free play
+
+        Returns:
+            list: list of string of actions
+        '''
+        key = (hand, target)
+        actions = self._moves.get(key)
+        if actions is None:
+            if target is None:
+                legal_actions = list(MOVE_CACHE.playable_moves(hand))
+            else:
+                legal_actions = gt_cards_from_hand(hand, target)
+            if legal_actions == ['pass']:
+                actions = legal_actions
+            else:
+                ranked = {}
+                for card_type, moves in classify_actions(legal_actions).items():
+                    for rank, (action, _) in enumerate(moves):
+                        ranked[action] = min(ranked.get(action, rank), rank)
+                actions = sorted(ranked, key=lambda action: (action != hand, -len(action), ranked[action]))
+            self._moves[key] = actions
+        return actions
+
+    def solve(self, hands, player_id, current_player, leader=None, target=None):
+        ''' Solve a position for player_id
+
+        Args:
+            hands (list): the sorted hand of every player, e.g. ['3445', ...]
+            player_id (int): the solving player
+            current_player (int): the player to act
+            leader (int): the player who played target, None for a free play
+            target (str): the cards to beat
+
+        Returns:
+            (tuple): Tuple containing:
+
+                (boolean): True if player_id wins against any play of the others
+                (str): a winning action if player_id is to act and wins, otherwise None
+
+        Raises:
+            SolverBudgetExceeded: if the search runs out of nodes or time
+        '''
+        if leader is None or leader == current_player:
+            leader, target = None, None
+        # a solver kept over many games would grow without limit
+        if len(self.table) > self.max_entries or len(self._moves) > self.max_entries:
+            self.clear()
+        codes = [str2code(hand) for hand in hands]
+        start = time.time()
+        self.nodes = 0
+        self._deadline = None if self.time_limit is None else start + self.time_limit
+        try:
+            if current_player != player_id:
+                return self._search(player_id, codes, current_player, leader, target), None
+            # search the root by hand to keep the winning action
+            hand = code2str(codes[current_player])
+            for action in self.ordered_actions(hand, target):
+                if self._child(player_id, codes, current_player, leader, target, action):
+                    return True, action
+            return False, None
+        finally:
+            self.seconds = time.time() - start
+
+    def _child(self, player_id, codes, current, leader, target, action):
+        ''' Whether player_id wins after current plays action
+        '''
+        next_player = (current + 1) % self.num_players
+        if action == 'pass':
+            # the leader plays freely once the others passed
+            if next_player == leader:
+                leader, target = None, None
+            return self._search(player_id, codes, next_player, leader, target)
+        code = codes[current] - str2code(action)
+        if not code:
+            return current == player_id
+        codes = list(codes)
+        codes[current] = code
+        return self._search(player_id, codes, next_player, current, action)
+
+    def _search(self, player_id, codes, current, leader, target):
+        key = (player_id, tuple(codes), current, leader, target)
+        won = self.table.get(key)
+        if won is not None:
+            return won
+        self.nodes += 1
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            raise SolverBudgetExceeded('More than {} nodes'.format(self.max_nodes))
+        if self._deadline is not None and not self.nodes & 1023 and time.time() > self._deadline:
+            raise SolverBudgetExceeded('More than {} seconds'.format(self.time_limit))
+
+        maximize = current == player_id
+        # cut off at the first child which decides the node
+        won = not maximize
+        for action in self.ordered_actions(code2str(codes[current]), target):
+            if self._child(player_id, codes, current, leader, target, action) == maximize:
+                won = maximize
+                break
+        self.table[key] = won
+        return won
+
+
+def position_from_trace(trace, current_player):
+    ''' Get the leader and the target cards from the trace of a game
+
+    Args:
+        trace (list): list of (player_id, action)
+        current_player (int): the player to act
+
+    Returns:
+        (tuple): the leader and the target, (None, None) for a free play
+    '''
+    for player_id, action in reversed(trace):
+        if action != 'pass':
+            if player_id == current_player:
+                break
+            return player_id, action
+    return None, None
@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+''' Paodekuai card tables
+
+The large json tables (pdk_specific_map, pdk_card_type and pdk_type_card)
+are compiled into flat integer arrays saved as .npy files in jsondata, see
+rules.create_binary_tables. Every specific action gets a dense id, its order
+in pdk_specific_map, and the tables are arrays indexed by that id:
+
+    pdk_specific_cards.npy      uint8, the specific actions as space separated ASCII
+    pdk_specific_abstract.npy   uint16, index of the abstract action in ACTION_LIST
+    pdk_card_type_offsets.npy   uint32, the (type, weight) pairs of each specific action
+    pdk_card_type_pairs.npy     uint8, (type id, weight) pairs
+    pdk_type_card_buckets.npy   uint8, (type id, weight) of every bucket of pdk_type_card
+    pdk_type_card_offsets.npy   uint32, the specific actions of each bucket
+    pdk_type_card_ids.npy       uint32, ids of the specific actions in the buckets
+    pdk_tables.json             names of the abstract actions and the types
+    pdk_action_planes.npy       uint8, (num_actions, 4, 13) planes of the actions,
+                                as pdkutils.encode_cards, zeros for 'pass'
+
+The ids are also the integer actions of PaodekuaiEnv in 'action_ids' mode.
+
+Nothing is read until a table is first accessed, the arrays are memory-mapped
+so worker processes share them, and entries are turned into python objects
+only when they are looked up. If the binary files have not been built, the
+json files are read and compiled in memory instead.
+'''
+import os
+import json
+import numpy as np
+from collections import OrderedDict
+from collections.abc import Mapping
+
+PACKAGE_PATH = os.path.dirname(os.path.abspath(__file__))
+
+ARRAY_FILES = {'specific_cards': 'pdk_specific_cards.npy',
+               'specific_abstract': 'pdk_specific_abstract.npy',
+               'card_type_offsets': 'pdk_card_type_offsets.npy',
+               'card_type_pairs': 'pdk_card_type_pairs.npy',
+               'type_card_buckets': 'pdk_type_card_buckets.npy',
+               'type_card_offsets': 'pdk_type_card_offsets.npy',
+               'type_card_ids': 'pdk_type_card_ids.npy'}
+META_FILE = 'pdk_tables.json'
+PLANES_FILE = 'pdk_action_planes.npy'
+JSON_FILES = {'specific_map': 'pdk_specific_map.json',
+              'action_space': 'pdk_action_space.json',
+              'card_type': 'pdk_card_type.json',
+              'type_card': 'pdk_type_card.json'}
+# specific actions which are not abstract actions, i.e. not in SPECIFIC_MAP
+NO_ABSTRACT = 0xFFFF
+
+
+def read_json_tables(path):
+    ''' Read the json tables
+
+    Returns:
+        dict: specific_map, action_space, card_type and type_card
+    '''
+    tables = {}
+    for name, file in JSON_FILES.items():
+        with open(os.path.join(path, file), 'r') as f:
+            tables[name] = json.load(f, object_pairs_hook=OrderedDict)
+    return tables
+
+
+def compile_tables(specific_map, action_space, card_type, type_card):
+    ''' Compile the json tables into arrays
+
+    Returns:
+        (tuple): Tuple containing:
+
+            (dict): arrays keyed as ARRAY_FILES
+            (dict): the meta data, names of the abstract actions and the types
+    '''
+    names = list(specific_map)
+    names += [cards for cards in card_type if cards not in specific_map]
+    index = {cards: idx for idx, cards in enumerate(names)}
+    actions = list(action_space)
+    types = list(type_card)
+    type_index = {name: idx for idx, name in enumerate(types)}
+
+    abstract = [action_space[specific_map[cards][0]] if cards in specific_map else NO_ABSTRACT
+                for cards in names]
+    type_offsets = [0]
+    type_pairs = []
+    for cards in names:
+        for name, weight in card_type.get(cards, ()):
+            type_pairs.append((type_index[name], int(weight)))
+        type_offsets.append(len(type_pairs))
+
+    buckets = []
+    bucket_offsets = [0]
+    bucket_ids = []
+    for name, weights in type_card.items():
+        for weight, cards_list in weights.items():
+            buckets.append((type_index[name], int(weight)))
+            bucket_ids += [index[cards] for cards in cards_list]
+            bucket_offsets.append(len(bucket_ids))
+
+    arrays = {'specific_cards': np.frombuffer(' '.join(names).encode('ascii'), dtype=np.uint8),
+              'specific_abstract': np.array(abstract, dtype=np.uint16),
+              'card_type_offsets': np.array(type_offsets, dtype=np.uint32),
+              'card_type_pairs': np.array(type_pairs, dtype=np.uint8).reshape(-1, 2),
+              'type_card_buckets': np.array(buckets, dtype=np.uint8).reshape(-1, 2),
+              'type_card_offsets': np.array(bucket_offsets, dtype=np.uint32),
+              'type_card_ids': np.array(bucket_ids, dtype=np.uint32)}
+    meta = {'actions': actions, 'types': types}
+    return arrays, meta
+
+
+def compile_planes(names):
+    ''' Encode the planes of all the specific actions
+
+    Args:
+        names (list): the specific actions in the order of their ids
+
+    Returns:
+        (numpy.array): uint8 array of shape (len(names), 4, 13)
+    '''
+    from pdkutils import _RANK_OF_BYTE, COUNT_COLUMNS
+    names = [cards if cards != 'pass' else '' for cards in names]
+    num = len(names)
+    ranks = _RANK_OF_BYTE[np.frombuffer(''.join(names).encode('ascii'), dtype=np.uint8)]
+    keys = np.repeat(np.arange(0, 14 * num, 14), [len(cards) for cards in names]) + ranks
+    counts = np.bincount(keys, minlength=14 * num).reshape(num, 14)[:, :13]
+    # card_type also lists actions with more than 4 cards of a rank, which no
+    # hand of the 48 cards holds, their planes are clipped
+    return np.ascontiguousarray(COUNT_COLUMNS[np.minimum(counts, 4)].transpose(0, 2, 1))
+
+
+def save_tables(arrays, meta, path):
+    ''' Save compiled tables into path
+    '''
+    for name, file in ARRAY_FILES.items():
+        np.save(os.path.join(path, file), arrays[name])
+    with open(os.path.join(path, META_FILE), 'w') as file:
+        json.dump(meta, file)
+
+
+def save_planes(names, path):
+    ''' Save the planes of the specific actions into path
+    '''
+    np.save(os.path.join(path, PLANES_FILE), compile_planes(names))
+
+
+class CardTables(object):
+    ''' The card tables, loaded on first access
+    '''
+
+    def __init__(self, path):
+        ''' Initialize the tables
+
+        Args:
+            path (str): the directory of the tables
+        '''
+        self.path = path
+        self.loaded = False
+        self._planes = None
+        self.specific_map = SpecificMap(self)
+        self.card_type = CardType(self)
+        self.type_card = TypeCard(self)
+
+    def load(self):
+        ''' Map the binary tables, or compile the json ones if they are not built
+        '''
+        if self.loaded:
+            return
+        files = [os.path.join(self.path, file) for file in ARRAY_FILES.values()]
+        if all(os.path.exists(file) for file in files):
+            arrays = {name: np.load(file, mmap_mode='r') for name, file in zip(ARRAY_FILES, files)}
+            with open(os.path.join(self.path, META_FILE), 'r') as file:
+                meta = json.load(file)
+        else:
+            arrays, meta = compile_tables(**read_json_tables(self.path))
+        self.names = arrays['specific_cards'].tobytes().decode('ascii').split(' ')
+        self.index = dict(zip(self.names, range(len(self.names))))
+        self.abstract = arrays['specific_abstract'].tolist()
+        self.card_type_offsets = arrays['card_type_offsets'].tolist()
+        self.card_type_pairs = arrays['card_type_pairs']
+        self.type_card_buckets = arrays['type_card_buckets'].tolist()
+        self.type_card_offsets = arrays['type_card_offsets'].tolist()
+        self.type_card_ids = arrays['type_card_ids']
+        self.actions = meta['actions']
+        self.types = meta['types']
+        self.loaded = True
+
+    def __len__(self):
+        self.load()
+        return len(self.names)
+
+    def encode_actions(self, actions):
+        ''' Get the ids of specific actions
+
+        Args:
+            actions (list): a list of specific actions, e.g. ['33345', 'pass']
+
+        Returns:
+            (numpy.array): int32 array of the action ids
+        '''
+        self.load()
+        return np.fromiter(map(self.index.__getitem__, actions), dtype=np.int32, count=len(actions))
+
+    @property
+    def planes(self):
+        ''' The read-only (num_actions, 4, 13) uint8 planes of all the specific actions
+
+        They are memory-mapped from PLANES_FILE, so worker processes share them,
+        or encoded on first access if the file has not been built.
+        '''
+        if self._planes is None:
+            file = os.path.join(self.path, PLANES_FILE)
+            if os.path.exists(file):
+                planes = np.asarray(np.load(file, mmap_mode='r'))
+            else:
+                self.load()
+                planes = compile_planes(self.names)
+                planes.flags.writeable = False
+            self._planes = planes
+        return self._planes
+
+    def encode_planes(self, actions, out=None):
+        ''' Gather the planes of specific actions from the table
+
+        Args:
+            actions (list): a list of specific actions, or an array of their ids
+            out (numpy.array): the buffer of shape (len(actions), 4, 13), of any dtype
+
+        Returns:
+            (numpy.array): the planes, out if given
+        '''
+        if not isinstance(actions, np.ndarray):
+            actions = self.encode_actions(actions)
+        if out is None:
+            return self.planes[actions]
+        out[...] = self.planes[actions]
+        return out
+
+    def decode_action(self, action_id):
+        ''' Get the specific action of an id
+
+        Args:
+            action_id (int): the id of the action
+
+        Returns:
+            (str): the specific action, e.g. '33345'
+        '''
+        self.load()
+        return self.names[action_id]
+
+
+class SpecificMap(Mapping):
+    ''' Lazy SPECIFIC_MAP: specific action -> [abstract action]
+    '''
+
+    def __init__(self, tables):
+        self._tables = tables
+        self._cache = {}
+
+    def __getitem__(self, cards):
+        res = self._cache.get(cards)
+        if res is None:
+            tables = self._tables
+            tables.load()
+            abstract = tables.abstract[tables.index[cards]]
+            if abstract == NO_ABSTRACT:
+                raise KeyError(cards)
+            res = self._cache[cards] = [tables.actions[abstract]]
+        return res
+
+    def __contains__(self, cards):
+        tables = self._tables
+        tables.load()
+        idx = tables.index.get(cards)
+        return idx is not None and tables.abstract[idx] != NO_ABSTRACT
+
+    def __iter__(self):
+        tables = self._tables
+        tables.load()
+        return (cards for cards, abstract in zip(tables.names, tables.abstract) if abstract != NO_ABSTRACT)
+
+    def __len__(self):
+        tables = self._tables
+        tables.load()
+        return len(tables.abstract) - tables.abstract.count(NO_ABSTRACT)
+
+
+class CardTypeMap(Mapping):
+    ''' Lazy CARD_TYPE[0]: specific action -> [[type, weight], ...]
+    '''
+
+    def __init__(self, tables):
+        self._tables = tables
+        self._cache = {}
+
+    def __getitem__(self, cards):
+        res = self._cache.get(cards)
+        if res is None:
+            tables = self._tables
+            tables.load()
+            idx = tables.index[cards]
+            start, end = tables.card_type_offsets[idx], tables.card_type_offsets[idx + 1]
+            if start == end:
+                raise KeyError(cards)
+            res = self._cache[cards] = [[tables.types[name], str(weight)]
+                                        for name, weight in tables.card_type_pairs[start:end].tolist()]
+        return res
+
+    def __contains__(self, cards):
+        tables = self._tables
+        tables.load()
+        idx = tables.index.get(cards)
+        return idx is not None and tables.card_type_offsets[idx] != tables.card_type_offsets[idx + 1]
+
+    def __iter__(self):
+        tables = self._tables
+        tables.load()
+        offsets = tables.card_type_offsets
+        return (cards for idx, cards in enumerate(tables.names) if offsets[idx] != offsets[idx + 1])
+
+    def __len__(self):
+        tables = self._tables
+        tables.load()
+        offsets = tables.card_type_offsets
+        return sum(offsets[idx] != offsets[idx + 1] for idx in range(len(tables.names)))
+
+
+class CardType(object):
+    ''' Lazy CARD_TYPE, the tuple (dict, list, set) of specific actions with their types
+    '''
+
+    def __init__(self, tables):
+        self._items = [CardTypeMap(tables), None, None]
+
+    def __getitem__(self, idx):
+        if self._items[idx] is None:
+            self._items[idx] = list(self._items[0]) if idx == 1 else set(self._items[0])
+        return self._items[idx]
+
+    def __len__(self):
+        return 3
+
+    def __iter__(self):
+        return (self[idx] for idx in range(3))
+
+
+class TypeCard(Mapping):
+    ''' Lazy TYPE_CARD: type -> weight -> [specific action, ...]
+    '''
+
+    def __init__(self, tables):
+        self._tables = tables
+        self._cache = {}
+
+    def __getitem__(self, name):
+        res = self._cache.get(name)
+        if res is None:
+            tables = self._tables
+            tables.load()
+            if name not in tables.types:
+                raise KeyError(name)
+            type_id = tables.types.index(name)
+            res = OrderedDict()
+            for bucket, (bucket_type, weight) in enumerate(tables.type_card_buckets):
+                if bucket_type == type_id:
+                    ids = tables.type_card_ids[tables.type_card_offsets[bucket]:tables.type_card_offsets[bucket + 1]]
+                    res[str(weight)] = [tables.names[idx] for idx in ids.tolist()]
+            res = self._cache[name] = res
+        return res
+
+    def __iter__(self):
+        self._tables.load()
+        return iter(self._tables.types)
+
+    def __len__(self):
+        self._tables.load()
+        return len(self._tables.types)
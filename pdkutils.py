@@ -6,29 +6,30 @@ import json
 import numpy as np
 from collections import OrderedDict
 import threading
+import functools
 import collections
 from pdkcore import Card
+from pdktables import CardTables
 
-# Read required docs
-ROOT_PATH = os.getcwd()
-
-# a map of action to abstract action
-with open(os.path.join(ROOT_PATH, 'jsondata/pdk_specific_map.json'), 'r') as file:
-    SPECIFIC_MAP = json.load(file, object_pairs_hook=OrderedDict)
+# Read required docs, relative to the package rather than the working directory
+ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
 
 # a map of abstract action to its index and a list of abstract action
 with open(os.path.join(ROOT_PATH, 'jsondata/pdk_action_space.json'), 'r') as file:
     ACTION_SPACE = json.load(file, object_pairs_hook=OrderedDict)
     ACTION_LIST = list(ACTION_SPACE.keys())
 
+# the large tables are loaded on first access, see pdktables
+CARD_TABLES = CardTables(os.path.join(ROOT_PATH, 'jsondata'))
+
+# a map of action to abstract action
+SPECIFIC_MAP = CARD_TABLES.specific_map
+
 # a map of card to its type. Also return both dict and list to accelerate
-with open(os.path.join(ROOT_PATH, 'jsondata/pdk_card_type.json'), 'r') as file:
-    data = json.load(file, object_pairs_hook=OrderedDict)
-    CARD_TYPE = (data, list(data), set(data))
+CARD_TYPE = CARD_TABLES.card_type
 
 # a map of type to its cards
-with open(os.path.join(ROOT_PATH, 'jsondata/pdk_type_card.json'), 'r') as file:
-    TYPE_CARD = json.load(file, object_pairs_hook=OrderedDict)
+TYPE_CARD = CARD_TABLES.type_card
 
 # rank list of solo character of cards
 CARD_RANK_STR = ['3', '4', '5', '6', '7', '8', '9', 'T', 'J', 'Q', 'K',
@@ -74,6 +75,14 @@ def init_48_deck():
     return res
 
 
+# the 48 cards sorted by rank, the engine represents a card by its index in this deck
+DECK_48 = sorted(init_48_deck(), key=lambda card: CARD_RANK_STR_INDEX[card.rank])
+# the rank character, the rank index and the suit of every card index
+CARD_INDEX_RANK = ''.join([card.rank for card in DECK_48])
+CARD_INDEX_RANK_ID = [CARD_RANK_STR_INDEX[card.rank] for card in DECK_48]
+CARD_INDEX_SUIT = [card.suit for card in DECK_48]
+
+
 def get_upstream_player_id(player, players):
     ''' Obtain the upsteam player's player_id
 
@@ -200,30 +209,33 @@ def cards2str_with_suit(cards):
     ''' Get the corresponding string representation of cards with suit
 
     Args:
-        cards (list): list of Card objects
+        cards (list): list of card indexes in DECK_48, or of Card objects
 
     Returns:
         string: string representation of cards
     '''
-    return ' '.join([card.suit + card.rank for card in cards])
+    return ' '.join([CARD_INDEX_SUIT[card] + CARD_INDEX_RANK[card] if isinstance(card, int)
+                     else card.suit + card.rank for card in cards])
 
 
 def cards2str(cards):
     ''' Get the corresponding string representation of cards
 
     Args:
-        cards (list): list of Card objects
+        cards (list): list of card indexes in DECK_48, or of Card objects
 
     Returns:
         string: string representation of cards
     '''
-    response = ''
+    response = []
     for card in cards:
-        if card.rank == '':
-            response += card.suit[0]
+        if isinstance(card, int):
+            response.append(CARD_INDEX_RANK[card])
+        elif card.rank == '':
+            response.append(card.suit[0])
         else:
-            response += card.rank
-    return response
+            response.append(card.rank)
+    return ''.join(response)
 
 
 class LocalObjs(threading.local):
@@ -282,6 +294,13 @@ def encode_cards(plane, cards):
     '''
     if not cards:
         return None
+    # the planes of actions are gathered from the table
+    if isinstance(cards, str):
+        CARD_TABLES.load()
+        action_id = CARD_TABLES.index.get(cards)
+        if action_id is not None:
+            np.putmask(plane, CARD_TABLES.planes[action_id], 1)
+            return None
     cards_pool = list(cards)
     layer = 0
     while cards_pool:
@@ -314,6 +333,37 @@ def encode_cards(plane, cards):
     #     plane[0][rank] = 0
 
 
+# byte of a rank character -> its index in CARD_RANK_STR, 13 for other bytes
+_RANK_OF_BYTE = np.full(256, 13, dtype=np.intp)
+for _index, _rank in enumerate(CARD_RANK_STR):
+    _RANK_OF_BYTE[ord(_rank)] = _index
+# count of a rank -> its column in a plane, e.g. 2 -> [1, 1, 0, 0]
+COUNT_COLUMNS = np.tril(np.ones((5, 4), dtype=np.uint8), -1)
+
+
+def encode_planes(out, cards_list):
+    ''' Encode several cards into planes at once, the same encoding as encode_cards.
+
+    Args:
+        out (numpy.array): the buffer of shape (len(cards_list), 4, 13), of any dtype,
+            it is overwritten, so planes of empty cards are zeros
+        cards_list (list): list of str of cards, '' or None for no cards
+
+    Returns:
+        (numpy.array): out
+    '''
+    cards_list = [cards or '' for cards in cards_list]
+    num = len(cards_list)
+    ranks = _RANK_OF_BYTE[np.frombuffer(''.join(cards_list).encode('ascii'), dtype=np.uint8)]
+    # count the ranks of all the planes in a single pass, with a spare column per plane
+    keys = np.repeat(np.arange(0, 14 * num, 14), [len(cards) for cards in cards_list]) + ranks
+    counts = np.bincount(keys, minlength=14 * num).reshape(num, 14)
+    if counts[:, 13].any():
+        raise ValueError('Unknown cards in {}'.format(cards_list))
+    out[...] = COUNT_COLUMNS[counts[:, :13]].transpose(0, 2, 1)
+    return out
+
+
 def visual_cards(plane):
     if plane is not None:
         if isinstance(plane, str):
@@ -343,37 +393,9 @@ def gt_greater_cards_from_hands(current_hand, target_cards):
     :param others: (str) the hands to be compared, must be legal cards in the game
     :return:
     """
-    from pdkjudger import PaodekuaiJudger
-    gt_cards = []
-    contains_legal = PaodekuaiJudger.playable_cards_from_hand(current_hand)
-    target_types = CARD_TYPE[0][target_cards]
-    type_dict = {}  # type_dict stores the target types which the player is trying to beat with
-    # if cards can be multiply explained, choose the largest one
-    for card_type, weight in target_types:  # e.g. [['plane_chain_3', '0'], ['plane_chain_3', '1'],...]
-        if card_type in type_dict:
-            if int(type_dict[card_type]) < int(weight):
-                type_dict[card_type] = weight
-        else:
-            type_dict[card_type] = weight
-
-    # if 'rocket' in type_dict:
-    #     return gt_cards
-    # type_dict['rocket'] = -1
-    if 'bomb' not in type_dict:
-        type_dict['bomb'] = -1
-    for card_type, weight in type_dict.items():
-        candidate = TYPE_CARD[card_type]
-        for can_weight, cards_list in candidate.items():
-            if int(can_weight) > int(weight):
-                for cards in cards_list:
-                    # TODO: improve efficiency
-                    if cards not in gt_cards and cards in contains_legal:
-                        # if self.contains_cards(current_hand, cards): \\\contains_cards(current_hand, cards)
-                        gt_cards.append(cards)
-    # add 'pass' to legal actions, if no bigger cards
-    if not gt_cards:
-        gt_cards += ['pass']
-    return gt_cards
+    from pdkmovegen import gt_cards_from_hand
+    # only the types of target_cards and bombs are generated, see pdkmovegen
+    return gt_cards_from_hand(current_hand, target_cards)
 
 
 def get_gt_cards(player, greater_player):
@@ -391,7 +413,7 @@ def get_gt_cards(player, greater_player):
         1. return value contains 'pass' iff the player has no greater cards
     '''
 
-    current_hand = cards2str(player.current_hand)
+    current_hand = player.current_hand_str
     target_cards = greater_player.played_cards
 
     return gt_greater_cards_from_hands(current_hand, target_cards)
@@ -426,20 +448,25 @@ def hands_islands(plane):
     return sum(front_path > back_path)
 
 
-def sort_card(cards):
+def sort_card(cards, cache=False):
     """
     i.e. '43592TAK' -> return '3459TKA2'
-    :param cards: (str) of cards
+    Counting sort over the 13 ranks, characters which are not ranks are dropped.
+    :param cards: (str) of cards, or an iterable of rank characters
+    :param cache: (bool) look the result up in a cache shared by all the callers,
+        worth it for strings which come back often, e.g. hands
     :return:
     """
-    ORDER = '3456789TJQKA2'
-    res = ''
-    candid = list(cards)
-    for card in ORDER:
-        while card in candid:
-            res += card
-            candid.remove(card)
-    return res
+    if not isinstance(cards, str):
+        cards = ''.join(cards)
+    if cache:
+        return _sort_card_cached(cards)
+    return ''.join([rank * cards.count(rank) for rank in CARD_RANK_STR])
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _sort_card_cached(cards):
+    return ''.join([rank * cards.count(rank) for rank in CARD_RANK_STR])
 
 
 # Test json order
@@ -0,0 +1,208 @@
+''' Optional profiling of the phases of a game step
+
+The phases are methods of the engine and of the env. PROFILER.enable()
+replaces them by timed wrappers and disable() puts the originals back, so
+the profiler costs nothing while it is disabled. It records for every phase
+the calls and the time spent inside, children included, and the hit rates
+of the caches of the engine.
+
+Example:
+    from profiling import PROFILER
+
+    with PROFILER.profile():
+        env.run()
+    print(PROFILER.report())
+
+    # or, for a long run, dump the results on kill -USR1 <pid>
+    PROFILER.enable()
+    PROFILER.install_signal()
+'''
+import sys
+import json
+import time
+import signal
+import atexit
+import importlib
+import functools
+
+# phase -> (module, class or None for a module function, attribute)
+PHASES = {'env.run': ('pdkenv', 'Env', 'run'),
+          'env.step': ('pdkenv', 'Env', 'step'),
+          'env._extract_state': ('pdkenv', 'PaodekuaiEnv', '_extract_state'),
+          'env.transition_reward': ('pdkenv', 'PaodekuaiEnv', 'transition_reward'),
+          'game.step': ('pdkgame', 'PaodekuaiGame', 'step'),
+          'game.get_state': ('pdkgame', 'PaodekuaiGame', 'get_state'),
+          'game._get_others_current_hand': ('pdkgame', 'PaodekuaiGame', '_get_others_current_hand'),
+          'round.proceed_round': ('pdkround', 'PaodekuaiRound', 'proceed_round'),
+          'judger.calc_playable_cards': ('pdkjudger', 'PaodekuaiJudger', 'calc_playable_cards'),
+          'judger.judge_game': ('pdkjudger', 'PaodekuaiJudger', 'judge_game'),
+          'player.available_actions': ('pdkplayer', 'PaodekuaiPlayer', 'available_actions'),
+          'player.get_gt_cards': ('pdkplayer', None, 'get_gt_cards'),
+          'player.get_state': ('pdkplayer', 'PaodekuaiPlayer', 'get_state')}
+
+
+def _move_cache_stats():
+    from pdkmovegen import MOVE_CACHE
+    return MOVE_CACHE.hits, MOVE_CACHE.misses
+
+
+def _sort_card_stats():
+    from pdkutils import _sort_card_cached
+    info = _sort_card_cached.cache_info()
+    return info.hits, info.misses
+
+
+# cache -> function returning its (hits, misses) counters
+CACHES = {'movegen.MOVE_CACHE': _move_cache_stats,
+          'pdkutils.sort_card': _sort_card_stats}
+
+
+class Profiler(object):
+    ''' Per-phase timings and call counts, and cache hit rates
+    '''
+
+    def __init__(self, phases=PHASES, caches=CACHES):
+        ''' Initialize the profiler
+
+        Args:
+            phases (dict): phase -> (module, class, attribute) of the functions to time
+            caches (dict): cache -> function returning its (hits, misses)
+        '''
+        self.phases = dict(phases)
+        self.caches = dict(caches)
+        self.enabled = False
+        self._originals = {}
+        self.reset()
+
+    def reset(self):
+        ''' Drop the recorded timings and restart the cache counters
+        '''
+        # phase -> [calls, nanoseconds]
+        self.timings = {phase: [0, 0] for phase in self.phases}
+        self._cache_start = {name: stats() for name, stats in self.caches.items()}
+        self.start_time = time.time()
+
+    def _timed(self, phase, function):
+        timing = self.timings[phase]
+        perf_counter_ns = time.perf_counter_ns
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                timing[0] += 1
+                timing[1] += perf_counter_ns() - start
+        return wrapper
+
+    def enable(self):
+        ''' Replace the functions of the phases by timed wrappers
+        '''
+        if self.enabled:
+            return self
+        self.reset()
+        for phase, (module_name, class_name, attribute) in self.phases.items():
+            owner = importlib.import_module(module_name)
+            if class_name is not None:
+                owner = getattr(owner, class_name)
+            original = owner.__dict__[attribute] if class_name is not None else getattr(owner, attribute)
+            if isinstance(original, (staticmethod, classmethod)):
+                wrapped = type(original)(self._timed(phase, original.__func__))
+            else:
+                wrapped = self._timed(phase, original)
+            self._originals[phase] = (owner, attribute, original)
+            setattr(owner, attribute, wrapped)
+        self.enabled = True
+        return self
+
+    def disable(self):
+        ''' Put the original functions back, the timings are kept
+        '''
+        for owner, attribute, original in self._originals.values():
+            setattr(owner, attribute, original)
+        self._originals = {}
+        self.enabled = False
+        return self
+
+    def profile(self):
+        ''' Context manager enabling the profiler inside the block
+        '''
+        profiler = self
+
+        class _Profile(object):
+            def __enter__(self):
+                return profiler.enable()
+
+            def __exit__(self, *args):
+                profiler.disable()
+        return _Profile()
+
+    def stats(self):
+        ''' Get the recorded timings and cache hit rates
+
+        Returns:
+            (dict): 'phases' -> phase -> calls, total_ms, mean_us, and
+                'caches' -> cache -> hits, misses, hit_rate
+        '''
+        phases = {}
+        for phase, (calls, nanoseconds) in self.timings.items():
+            if calls:
+                phases[phase] = {'calls': calls,
+                                 'total_ms': nanoseconds / 1e6,
+                                 'mean_us': nanoseconds / calls / 1e3}
+        caches = {}
+        for name, stats in self.caches.items():
+            start_hits, start_misses = self._cache_start[name]
+            hits, misses = stats()
+            hits, misses = hits - start_hits, misses - start_misses
+            caches[name] = {'hits': hits, 'misses': misses,
+                            'hit_rate': hits / (hits + misses) if hits + misses else 0.}
+        return {'seconds': time.time() - self.start_time, 'phases': phases, 'caches': caches}
+
+    def to_json(self, file=None):
+        ''' Dump the stats as json, into file if given
+
+        Returns:
+            (str): the json
+        '''
+        res = json.dumps(self.stats(), indent=2)
+        if file is not None:
+            with open(file, 'w') as f:
+                f.write(res)
+        return res
+
+    def report(self):
+        ''' Format the stats as a table, the phases by total time
+        '''
+        stats = self.stats()
+        lines = ['{:<32}{:>12}{:>14}{:>12}'.format('phase', 'calls', 'total ms', 'mean us')]
+        for phase, timing in sorted(stats['phases'].items(), key=lambda item: -item[1]['total_ms']):
+            lines.append('{:<32}{:>12}{:>14.1f}{:>12.2f}'.format(
+                phase, timing['calls'], timing['total_ms'], timing['mean_us']))
+        lines.append('{:<32}{:>12}{:>14}{:>12}'.format('cache', 'hits', 'misses', 'hit rate'))
+        for name, cache in stats['caches'].items():
+            lines.append('{:<32}{:>12}{:>14}{:>12.3f}'.format(
+                name, cache['hits'], cache['misses'], cache['hit_rate']))
+        return '\n'.join(lines)
+
+    def dump(self, file=None):
+        ''' Write the report to stderr, or the json to file
+        '''
+        if file is None:
+            sys.stderr.write(self.report() + '\n')
+        else:
+            self.to_json(file)
+
+    def install_signal(self, signum=signal.SIGUSR1, file=None):
+        ''' Dump the stats whenever the process receives signum
+        '''
+        signal.signal(signum, lambda *args: self.dump(file))
+
+    def dump_at_exit(self, file=None):
+        ''' Dump the stats when the process exits
+        '''
+        atexit.register(self.dump, file)
+
+
+PROFILER = Profiler()
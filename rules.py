@@ -6,26 +6,10 @@ import os
 import json
 import itertools
 from collections import OrderedDict
+from pdkutils import sort_card
 
-ROOT_PATH = os.getcwd()
-
-# a map of action to abstract action, '33345' is legal in Paodekuai, but illegal in Doudizhu
-with open(os.path.join(ROOT_PATH, 'jsondata/pdk_specific_map.json'), 'r') as file:
-    SPECIFIC_MAP = json.load(file, object_pairs_hook=OrderedDict)
-
-# a map of abstract action to its index and a list of abstract action
-with open(os.path.join(ROOT_PATH, 'jsondata/pdk_action_space.json'), 'r') as file:
-    ACTION_SPACE = json.load(file, object_pairs_hook=OrderedDict)
-    ACTION_LIST = list(ACTION_SPACE.keys())
-
-# a map of card to its type. Also return both dict and list to accelerate
-with open(os.path.join(ROOT_PATH, 'jsondata/pdk_card_type.json'), 'r') as file:
-    data_card_type = json.load(file, object_pairs_hook=OrderedDict)
-    CARD_TYPE = (data_card_type, list(data_card_type), set(data_card_type))
-
-# a map of type to its cards
-with open(os.path.join(ROOT_PATH, 'jsondata/pdk_type_card.json'), 'r') as file:
-    TYPE_CARD = json.load(file, object_pairs_hook=OrderedDict)
+# the tables are written relative to the package rather than the working directory
+ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
 
 CARD_RANK_STR = ['3', '4', '5', '6', '7', '8', '9', 'T', 'J', 'Q', 'K',
                  'A', '2']
@@ -156,13 +140,7 @@ def bomb():
 def sort_card_rank(cards):
     if isinstance(cards[0], int):
         return cards.sort()
-    if isinstance(cards[0], str):
-        cards_idx = [CARD_RANK_STR_INDEX[c] for c in cards]
-        cards_idx.sort()
-        res = ''
-        for idx in cards_idx:
-            res += CARD_RANK_STR[idx]
-    return res
+    return sort_card(cards)
 
 
 def abstract2cards(abstract):
@@ -271,5 +249,112 @@ def create_jsons():
     with open(os.path.join(ROOT_PATH, 'jsondata/pdk_type_card.json'), 'w') as file:
         json.dump(TYPE_CARD, file)
 
-
-
+    create_binary_tables()
+
+
+def create_binary_tables(path=None):
+    """ Compile the json tables into the binary tables read by pdktables
+
+    Args:
+        path (str): the directory of the json tables and the output, jsondata by default
+    """
+    from pdktables import read_json_tables, compile_tables, save_tables, save_planes
+
+    path = os.path.join(ROOT_PATH, 'jsondata') if path is None else path
+    arrays, meta = compile_tables(**read_json_tables(path))
+    save_tables(arrays, meta, path)
+    save_planes(arrays['specific_cards'].tobytes().decode('ascii').split(' '), path)
+
+
+def opening_hands(hand_size=16):
+    """ Enumerate the rank counts of every hand of hand_size cards dealt from
+    the 48-card deck, in increasing order of their packed code (see pdkmovegen)
+    """
+    from pdkutils import init_48_deck
+    deck = [card.rank for card in init_48_deck()]
+    caps = [deck.count(rank) for rank in CARD_RANK_STR]
+    # the most cards the ranks below each rank can hold
+    room = [sum(caps[:rank]) for rank in range(len(caps) + 1)]
+    counts = [0] * len(caps)
+
+    def fill(rank, remaining):
+        # the highest rank is the most significant in the code, so it is fixed first
+        if rank < 0:
+            yield list(counts)
+            return
+        for count in range(max(0, remaining - room[rank]), min(caps[rank], remaining) + 1):
+            counts[rank] = count
+            yield from fill(rank - 1, remaining - count)
+        counts[rank] = 0
+
+    return fill(len(caps) - 1, hand_size)
+
+
+def _opening_moves(counts):
+    """ The key, the sorted move codes and the move text of a hand, see create_opening_table
+    """
+    from pdkmovegen import counts2code, code2str, playable_codes_from_counts
+    codes = sorted(playable_codes_from_counts(counts))
+    return counts2code(counts), codes, ' '.join(map(code2str, codes)).encode('ascii')
+
+
+def create_opening_table(hands=None, path=None, hand_size=16, chunk_size=1 << 20, workers=1):
+    """ Build the opening-hand move table read by pdkmovegen.OpeningTable
+
+    Every file of the table is written in chunks as the hands are generated,
+    so the memory stays bounded by chunk_size whatever the number of hands.
+    The complete table of the 16-card hands is large: about 8.5 million
+    hands and 1.2 billion moves, some 18 GB on disk and an hour of one cpu.
+
+    Args:
+        hands (iterable): strings of hands to include, every possible hand of
+            hand_size cards if None
+        path (str): the output directory, jsondata by default
+        hand_size (int): the size of the enumerated hands
+        chunk_size (int): the number of move codes buffered before writing
+        workers (int): the number of processes generating the moves
+    """
+    import numpy as np
+    from multiprocessing import Pool
+    from pdkmovegen import OPENING_TABLE_FILES, str2code, code2counts
+
+    path = os.path.join(ROOT_PATH, 'jsondata') if path is None else path
+    if hands is None:
+        signatures = opening_hands(hand_size)
+    else:
+        signatures = map(code2counts, sorted(set(map(str2code, hands))))
+
+    files = {name: open(os.path.join(path, file + '.tmp'), 'wb') for name, file in OPENING_TABLE_FILES.items()}
+    pool = Pool(workers) if workers > 1 else None
+    try:
+        # the hands come back in the order of their keys, which OpeningTable searches
+        results = pool.imap(_opening_moves, signatures, chunksize=256) if pool else map(_opening_moves, signatures)
+        keys, offsets, text_offsets = [], [0], [0]
+        moves, text = [], []
+        total, text_total = 0, 0
+        for key, codes, cards in results:
+            keys.append(key)
+            total += len(codes)
+            offsets.append(total)
+            text_total += len(cards)
+            text_offsets.append(text_total)
+            moves.extend(codes)
+            text.append(cards)
+            if len(moves) >= chunk_size:
+                for name, values in (('keys', keys), ('offsets', offsets), ('text_offsets', text_offsets),
+                                     ('moves', moves)):
+                    np.array(values, dtype='<u8').tofile(files[name])
+                files['text'].write(b''.join(text))
+                keys, offsets, text_offsets, moves, text = [], [], [], [], []
+        for name, values in (('keys', keys), ('offsets', offsets), ('text_offsets', text_offsets),
+                             ('moves', moves)):
+            np.array(values, dtype='<u8').tofile(files[name])
+        files['text'].write(b''.join(text))
+    finally:
+        if pool is not None:
+            pool.terminate()
+        for file in files.values():
+            file.close()
+    # replace the old table only once the new one is complete
+    for file in OPENING_TABLE_FILES.values():
+        os.replace(os.path.join(path, file + '.tmp'), os.path.join(path, file))
@@ -0,0 +1,272 @@
+''' Multiprocess self-play for Paodekuai
+
+Every worker process plays PaodekuaiEnv games and writes the transitions of
+all the players, in the order they were played, into its own ring buffer in
+shared memory:
+
+    obs       (6, 4, 13) uint8, the observation of the acting player
+    action    int32, the id of the specific action, see pdktables
+    reward    float32, the transition reward
+    done      bool, True for the last transition of a player in a game
+    player    int8, the acting player
+
+The worker is the only writer and the parent the only reader of a ring, so
+they only share two counters and no lock is taken. A worker waits while its
+ring is full, so the parent should collect regularly.
+'''
+import os
+import time
+import random
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import seeding
+
+RING_FIELDS = (('obs', (6, 4, 13), np.uint8),
+               ('action', (), np.int32),
+               ('reward', (), np.float32),
+               ('done', (), np.bool_),
+               ('player', (), np.int8))
+# the counters at the head of every ring
+WRITE, READ, GAMES, NUM_COUNTERS = 0, 1, 2, 3
+
+
+def default_agents():
+    ''' Three random agents, the default players of the workers
+    '''
+    from agents.random_agent import RandomAgent
+    return [RandomAgent() for _ in range(3)]
+
+
+class RingBuffer(object):
+    ''' A single-producer single-consumer ring of transitions in shared memory
+    '''
+
+    def __init__(self, capacity, name=None):
+        ''' Create a ring, or attach to the ring of name
+
+        Args:
+            capacity (int): the number of transitions the ring holds
+            name (str): the name of the shared memory of an existing ring
+        '''
+        self.capacity = capacity
+        size = 8 * NUM_COUNTERS
+        layout = []
+        for field, shape, dtype in RING_FIELDS:
+            shape = (capacity,) + shape
+            layout.append((field, shape, dtype, size))
+            # keep every field 8-byte aligned
+            size += -(-int(np.prod(shape)) * np.dtype(dtype).itemsize // 8) * 8
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.counters = np.ndarray((NUM_COUNTERS,), dtype=np.int64, buffer=self.shm.buf)
+        if name is None:
+            self.counters[:] = 0
+        self.fields = {field: np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset)
+                       for field, shape, dtype, offset in layout}
+
+    def __len__(self):
+        return int(self.counters[WRITE] - self.counters[READ])
+
+    def put(self, obs, action, reward, done, player, stop_event=None):
+        ''' Write one transition, waiting while the ring is full
+
+        Returns:
+            (boolean): False if stop_event was set while waiting
+        '''
+        while len(self) >= self.capacity:
+            if stop_event is not None and stop_event.is_set():
+                return False
+            time.sleep(0.001)
+        slot = self.counters[WRITE] % self.capacity
+        fields = self.fields
+        fields['obs'][slot] = obs
+        fields['action'][slot] = action
+        fields['reward'][slot] = reward
+        fields['done'][slot] = done
+        fields['player'][slot] = player
+        # publish the slot only once it is written
+        self.counters[WRITE] += 1
+        return True
+
+    def get(self, max_items=None):
+        ''' Copy out the transitions written since the last get
+
+        Args:
+            max_items (int): the most transitions to read, all if None
+
+        Returns:
+            (dict): arrays of the fields of RING_FIELDS
+        '''
+        start = int(self.counters[READ])
+        end = int(self.counters[WRITE])
+        if max_items is not None:
+            end = min(end, start + max_items)
+        slots = np.arange(start, end) % self.capacity
+        res = {field: array[slots] for field, array in self.fields.items()}
+        self.counters[READ] = end
+        return res
+
+    def close(self, unlink=False):
+        ''' Detach from the shared memory, and free it if unlink
+        '''
+        self.counters = self.fields = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _worker(name, capacity, seed, agents_fn, stop_event):
+    ''' Play games until stop_event is set, writing transitions into the ring of name
+    '''
+    from pdkenv import PaodekuaiEnv
+    from trajectory import TrajectoryRecorder
+
+    ring = RingBuffer(capacity, name)
+    # the dealer and the agents use the global generators
+    random.seed(seed)
+    np.random.seed(seed % 2 ** 32)
+    env = PaodekuaiEnv({'seed': seed, 'record_action': False, 'obs_dtype': np.uint8})
+    env.set_agents(agents_fn())
+    recorder = TrajectoryRecorder()
+    try:
+        while not stop_event.is_set():
+            recorder.clear()
+            batch, _ = env.run_columnar(recorder, is_training=True)
+            for row in range(len(batch.action)):
+                if not ring.put(batch.obs[row], batch.action[row], batch.reward[row], batch.done[row],
+                                batch.player[row], stop_event):
+                    return
+            ring.counters[GAMES] += 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ring.close()
+
+
+class SelfPlayPool(object):
+    ''' A pool of self-play worker processes
+
+    Example:
+        with SelfPlayPool(num_workers=8, seed=0) as pool:
+            while pool.transitions < 10 ** 6:
+                batch = pool.collect()
+                ...
+    '''
+
+    def __init__(self, num_workers=None, agents_fn=default_agents, capacity=1 << 16, seed=None):
+        ''' Initialize the pool
+
+        Args:
+            num_workers (int): the number of processes, the number of cpus if None
+            agents_fn (callable): builds the agents of a worker, it must be
+                picklable, e.g. a module level function
+            capacity (int): the number of transitions in the ring of a worker
+            seed (int): the seed of the pool, worker i is seeded with
+                seeding.hash_seed('{seed}-{i}'), and from the os if None
+        '''
+        self.num_workers = os.cpu_count() if num_workers is None else num_workers
+        self.agents_fn = agents_fn
+        self.capacity = capacity
+        self.seed = seed
+        # hash the whole string, create_seed keeps only its first 8 bytes
+        self.seeds = [seeding.create_seed() if seed is None else seeding.hash_seed('{}-{}'.format(seed, index))
+                      for index in range(self.num_workers)]
+        if len(set(self.seeds)) != self.num_workers:
+            raise ValueError('The seeds of the workers of the pool with seed {} are not distinct'.format(seed))
+        self.rings = []
+        self.workers = []
+        self.start_time = None
+        self.stop_event = None
+        self.transitions = 0
+
+    def start(self):
+        ''' Create the rings and start the workers
+        '''
+        self.stop_event = mp.Event()
+        for seed in self.seeds:
+            ring = RingBuffer(self.capacity)
+            worker = mp.Process(target=_worker, daemon=True,
+                                args=(ring.name, self.capacity, seed, self.agents_fn, self.stop_event))
+            self.rings.append(ring)
+            self.workers.append(worker)
+        for worker in self.workers:
+            worker.start()
+        self.start_time = time.time()
+        return self
+
+    def collect(self, max_items=None):
+        ''' Read the transitions written by all the workers
+
+        Args:
+            max_items (int): the most transitions read from each worker, all if None
+
+        Returns:
+            (dict): arrays of the fields of RING_FIELDS, and 'worker' the index of the writer
+        '''
+        for index, worker in enumerate(self.workers):
+            if worker.exitcode not in (None, 0):
+                raise RuntimeError('Self-play worker {} exited with code {}'.format(index, worker.exitcode))
+        parts = [ring.get(max_items) for ring in self.rings]
+        res = {field: np.concatenate([part[field] for part in parts]) for field, _, _ in RING_FIELDS}
+        res['worker'] = np.repeat(np.arange(len(parts)), [len(part['action']) for part in parts])
+        self.transitions += len(res['action'])
+        return res
+
+    @property
+    def games(self):
+        ''' The number of games finished by the workers
+        '''
+        return sum(int(ring.counters[GAMES]) for ring in self.rings)
+
+    def throughput(self):
+        ''' Get the games and transitions written per second since start
+
+        Returns:
+            (tuple): Tuple containing:
+
+                (float): games per second
+                (float): transitions per second
+        '''
+        elapsed = max(time.time() - self.start_time, 1e-9)
+        written = sum(int(ring.counters[WRITE]) for ring in self.rings)
+        return self.games / elapsed, written / elapsed
+
+    def stop(self, timeout=5):
+        ''' Stop the workers and free the rings
+
+        Workers finish the transition they are writing and exit, those still
+        alive after timeout are terminated.
+        '''
+        if self.stop_event is not None:
+            self.stop_event.set()
+        for worker in self.workers:
+            worker.join(timeout)
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
+        for ring in self.rings:
+            ring.close(unlink=True)
+        self.rings = []
+        self.workers = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+if __name__ == '__main__':
+    with SelfPlayPool(seed=0) as pool:
+        for _ in range(10):
+            time.sleep(1)
+            pool.collect()
+            games_rate, transitions_rate = pool.throughput()
+            print('{:.1f} games/s, {:.1f} transitions/s, {} transitions collected'.format(
+                games_rate, transitions_rate, pool.transitions))
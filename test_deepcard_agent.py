@@ -0,0 +1,29 @@
+''' The batched scoring of SL_Agent against the per-action loops it replaced
+'''
+import pytest
+
+torch = pytest.importorskip('torch')
+Deepcard = pytest.importorskip('Deepcard')
+pytest.importorskip('bottleneck')
+pytest.importorskip('joblib')
+
+from agents.deepcard_agent import action_losses
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_action_losses_order_as_loop(seed):
+    ''' The batched losses pick the action of the loop of loss_function over the actions
+    '''
+    generator = torch.Generator().manual_seed(seed)
+    prediction = torch.rand((1, 1, 4, 13), generator=generator)
+    tensor_cards = (torch.rand((40, 1, 4, 13), generator=generator) < 0.1).float()
+
+    choice = None
+    loss = 100000
+    for index, tensor_card in enumerate(tensor_cards):
+        new_loss = Deepcard.loss_function(prediction, tensor_card[None])
+        if new_loss < loss:
+            choice = index
+            loss = new_loss
+
+    assert int(action_losses(prediction, tensor_cards).argmin()) == choice
@@ -0,0 +1,41 @@
+''' The simulator of the ISMCTS agent against the game it copies
+'''
+import os
+
+import numpy as np
+import pytest
+
+from pdkgame import PaodekuaiGame
+from pdkutils import CARD_TABLES
+from pdktables import JSON_FILES
+from agents.ismcts_agent import Simulator
+
+pytestmark = pytest.mark.skipif(
+    not all(os.path.exists(os.path.join(CARD_TABLES.path, file)) for file in JSON_FILES.values()),
+    reason='the json tables are not built, see rules.create_jsons')
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_simulator_follows_game(seed):
+    ''' A Simulator stepped with the moves of random games has the legal actions,
+    the hands, the player to act and the winner of the game
+    '''
+    rng = np.random.RandomState(seed)
+    game = PaodekuaiGame()
+    game.np_random = rng
+    checked = 0
+    for _ in range(30):
+        game.init_game()
+        simulator = Simulator([player.current_hand_str for player in game.players],
+                              game.round.current_player, None, None)
+        while not game.is_over():
+            assert simulator.current == game.round.current_player
+            assert simulator.winner is None
+            assert sorted(simulator.legal_actions()) == sorted(game.state['actions'])
+            action = rng.choice(sorted(game.state['actions']))
+            game.step(action)
+            simulator.step(action)
+            assert simulator.hands == [player.current_hand_str for player in game.players]
+            checked += 1
+        assert simulator.winner == game.winner_id
+    assert checked > 0
@@ -0,0 +1,45 @@
+''' Differential tests of the incremental playable cards of PaodekuaiJudger
+'''
+import os
+
+import numpy as np
+import pytest
+
+from pdkgame import PaodekuaiGame
+from pdkjudger import PaodekuaiJudger
+from pdkutils import CARD_TABLES
+from pdktables import JSON_FILES
+
+pytestmark = pytest.mark.skipif(
+    not all(os.path.exists(os.path.join(CARD_TABLES.path, file)) for file in JSON_FILES.values()),
+    reason='the json tables are not built, see rules.create_jsons')
+
+
+def play_random_games(num_games, seed, step_back_prob=0.1):
+    ''' Play random games with random step backs, yielding the game after every move
+    '''
+    rng = np.random.RandomState(seed)
+    game = PaodekuaiGame(allow_step_back=True)
+    game.np_random = rng
+    for _ in range(num_games):
+        game.init_game()
+        while not game.is_over():
+            if game.round.trace and rng.rand() < step_back_prob:
+                game.step_back()
+            else:
+                game.step(rng.choice(sorted(game.state['actions'])))
+            yield game
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_incremental_playable_cards(seed):
+    ''' The playable cards of every player match a full regeneration by playable_cards_from_hand
+    '''
+    checked = 0
+    for game in play_random_games(30, seed):
+        for player in game.players:
+            expected = PaodekuaiJudger.playable_cards_from_hand(player.current_hand_str)
+            assert game.judger.playable_cards[player.player_id] == expected, player.current_hand_str
+            assert set(game.judger._playable_codes[player.player_id]) == expected, player.current_hand_str
+            checked += 1
+    assert checked > 0
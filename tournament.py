@@ -0,0 +1,319 @@
+''' Parallel tournaments of agents with early stopping
+
+The games are played in batches by a process pool. In a batch the agents
+take every seating in turn, so the advantage of a seat is shared equally.
+After every batch the running win rates and scores are updated, with their
+confidence intervals, and the tournament stops as soon as the difference of
+the two compared agents is decided, or after max_games.
+
+In duplicate mode every deal of a deterministic stream is played once in
+every seating: the deal is the same, only the agents change seats. The
+results of a deal are averaged over its seatings before they enter the
+statistics, so the luck of the cards cancels in the paired differences and
+far fewer games decide a comparison.
+
+The intervals are Student-t intervals over the rows of the statistics, the
+games or, in duplicate mode, the deals. Those of the stopping rule are also
+corrected for the repeated looks at the results (Bonferroni over the most
+looks the tournament can take), and the tournament does not stop before
+min_rows rows, so the error rate of an early decision stays below
+1 - confidence even for the heavy tailed differences of the scores.
+
+Example:
+    def make_agents():
+        return [RuleAgent(), RandomAgent(), RandomAgent()]
+
+    result = Tournament(make_agents, seed=0, duplicate=True).run()
+
+Runs with the same seed give the same results, bit for bit, whatever the
+number of workers.
+'''
+import os
+import math
+import random
+import itertools
+from statistics import NormalDist
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import seeding
+
+
+def t_quantile(p, df):
+    ''' The quantile of the Student t distribution, by bisection of its exact cdf
+
+    Args:
+        p (float): the probability, above 0.5
+        df (int): the degrees of freedom
+
+    Returns:
+        (float): the quantile
+    '''
+    if df >= 1000:
+        return NormalDist().inv_cdf(p)
+    target = 2 * p - 1
+
+    # P(|T| < t), Abramowitz and Stegun 26.7.3 and 26.7.4
+    def central(t):
+        theta = math.atan(t / math.sqrt(df))
+        cos2 = math.cos(theta) ** 2
+        term, total = 1., 1.
+        if df % 2:
+            if df == 1:
+                total = 0.
+            for k in range(1, (df - 1) // 2):
+                term *= cos2 * 2 * k / (2 * k + 1)
+                total += term
+            return 2 / math.pi * (theta + math.sin(theta) * math.cos(theta) * total)
+        for k in range(1, df // 2):
+            term *= cos2 * (2 * k - 1) / (2 * k)
+            total += term
+        return math.sin(theta) * total
+
+    low, high = 0., 1.
+    while central(high) < target:
+        high *= 2
+    for _ in range(60):
+        middle = (low + high) / 2
+        if central(middle) < target:
+            low = middle
+        else:
+            high = middle
+    return (low + high) / 2
+
+
+def deal_seeds(seed, num_deals):
+    ''' The deterministic stream of the seeds of the deals of a batch
+
+    Args:
+        seed (int): the seed of the batch
+        num_deals (int): the number of deals
+
+    Returns:
+        (list): the seeds of the deals
+    '''
+    seeds = [seeding.hash_seed('{}-deal-{}'.format(seed, deal)) for deal in range(num_deals)]
+    if len(set(seeds)) != num_deals:
+        raise ValueError('The deals of the batch with seed {} are not distinct'.format(seed))
+    return seeds
+
+
+def play_batch(agents_fn, num_games, seed, env_config=None, duplicate=False):
+    ''' Play games with the agents in every seating in turn
+
+    Args:
+        agents_fn (callable): builds the list of agents, it must be picklable
+        num_games (int): the games to play, a multiple of the seatings in duplicate mode
+        seed (int): the seed of the deals and of the global generators
+        env_config (dict): the config of PaodekuaiEnv
+        duplicate (boolean): play every deal in all the seatings
+
+    Returns:
+        (tuple): Tuple containing:
+
+            (numpy.array): the wins of the agents in every game, (num_games, num_agents),
+                or in every deal averaged over the seatings in duplicate mode
+            (numpy.array): the scores of the agents, as the wins
+    '''
+    from pdkenv import PaodekuaiEnv
+
+    random.seed(seed)
+    np.random.seed(seed % 2 ** 32)
+    config = {'record_action': False}
+    config.update(env_config or {})
+    config['seed'] = seed
+    env = PaodekuaiEnv(config)
+    agents = agents_fn()
+    seatings = list(itertools.permutations(range(len(agents))))
+    wins = np.zeros((num_games, len(agents)))
+    scores = np.zeros((num_games, len(agents)))
+    seeds = deal_seeds(seed, num_games // len(seatings)) if duplicate else None
+    for game in range(num_games):
+        # seating[seat] is the agent in the seat
+        seating = seatings[game % len(seatings)]
+        if duplicate:
+            # deal the same cards, and replay the same random choices of the agents, in every seating
+            game_seed = seeds[game // len(seatings)]
+            env._seed(game_seed)
+            random.seed(game_seed)
+            np.random.seed(game_seed % 2 ** 32)
+        env.set_agents([agents[agent] for agent in seating])
+        _, reward_seq = env.run(is_training=False)
+        wins[game, seating[env.game.winner_id]] = 1
+        for seat, reward in reward_seq:
+            scores[game, seating[seat]] += reward
+    if duplicate:
+        wins = wins.reshape(-1, len(seatings), len(agents)).mean(axis=1)
+        scores = scores.reshape(-1, len(seatings), len(agents)).mean(axis=1)
+    return wins, scores
+
+
+class RunningStats(object):
+    ''' Running mean and variance of vectors, Welford's algorithm
+    '''
+
+    def __init__(self, size):
+        self.count = 0
+        self.mean = np.zeros(size)
+        self.m2 = np.zeros(size)
+
+    def update(self, values):
+        ''' Add the rows of values
+        '''
+        for value in np.atleast_2d(values):
+            self.count += 1
+            delta = value - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (value - self.mean)
+
+    def interval(self, p):
+        ''' The Student-t confidence intervals of the means
+
+        Args:
+            p (float): the quantile of the bounds, 0.975 for a 95% interval
+
+        Returns:
+            (tuple): the lower and the upper bounds
+        '''
+        if self.count < 2:
+            return np.full_like(self.mean, -np.inf), np.full_like(self.mean, np.inf)
+        half = t_quantile(p, self.count - 1) * np.sqrt(self.m2 / (self.count - 1) / self.count)
+        return self.mean - half, self.mean + half
+
+
+class Tournament(object):
+    ''' A tournament of agents on a process pool
+    '''
+
+    def __init__(self, agents_fn, compare=(0, 1), max_games=1000, min_games=60, min_rows=30,
+                 batch_games=None, confidence=0.95, num_workers=None, seed=None, env_config=None, duplicate=False):
+        ''' Initialize the tournament
+
+        Args:
+            agents_fn (callable): builds the list of agents, it must be picklable,
+                e.g. a module level function
+            compare (tuple): the indexes of the two agents whose scores decide the stop
+            max_games (int): the most games to play
+            min_games (int): the games played before stopping early
+            min_rows (int): the rows of the statistics before stopping early, the games
+                or, in duplicate mode, the deals
+            batch_games (int): the games of a batch, a multiple of the seatings,
+                by default the seatings times 2
+            confidence (float): the confidence of the intervals
+            num_workers (int): the number of processes, the number of cpus if None
+            seed (int): the seed of the tournament, from the os if None
+            env_config (dict): the config of PaodekuaiEnv
+            duplicate (boolean): play every deal in all the seatings, see play_batch
+        '''
+        self.agents_fn = agents_fn
+        self.num_agents = len(agents_fn())
+        seatings = math.factorial(self.num_agents)
+        self.compare = compare
+        self.batch_games = 2 * seatings if batch_games is None else batch_games
+        if self.batch_games % seatings:
+            raise ValueError('batch_games must be a multiple of the {} seatings'.format(seatings))
+        self.max_games = max_games
+        self.min_games = min_games
+        self.min_rows = min_rows
+        self.confidence = confidence
+        self.num_workers = os.cpu_count() if num_workers is None else num_workers
+        self.seed = seeding.create_seed(seed)
+        self.env_config = env_config
+        self.duplicate = duplicate
+        # the games behind a row of the statistics
+        self.row_games = seatings if duplicate else 1
+        # the intervals of the report, and those of the stopping rule
+        self.p = 0.5 + confidence / 2
+        looks = max(-(-max_games // self.batch_games), 1)
+        self.p_stop = 1 - (1 - confidence) / 2 / looks
+        self.wins = RunningStats(self.num_agents)
+        self.scores = RunningStats(self.num_agents)
+        # the differences of the wins and the scores of the compared agents,
+        # paired by deal in duplicate mode
+        self.diffs = RunningStats(2)
+
+    @property
+    def games(self):
+        return self.wins.count * self.row_games
+
+    def update(self, wins, scores):
+        ''' Add the results of a batch
+        '''
+        first, second = self.compare
+        self.wins.update(wins)
+        self.scores.update(scores)
+        self.diffs.update(np.stack([wins[:, first] - wins[:, second], scores[:, first] - scores[:, second]], axis=1))
+
+    def decided(self):
+        ''' Whether the difference of the scores of the compared agents is decided
+
+        Returns:
+            (int): 1 if the first agent is better, -1 if the second, 0 if not decided
+        '''
+        if self.games < self.min_games or self.diffs.count < self.min_rows:
+            return 0
+        lower, upper = self.diffs.interval(self.p_stop)
+        if lower[1] > 0:
+            return 1
+        if upper[1] < 0:
+            return -1
+        return 0
+
+    def result(self):
+        ''' Get the results of the games played
+
+        Returns:
+            (dict): the games, the win rates and scores of the agents with their
+                intervals, and the decision of the comparison
+        '''
+        win_lower, win_upper = self.wins.interval(self.p)
+        score_lower, score_upper = self.scores.interval(self.p)
+        diff_lower, diff_upper = self.diffs.interval(self.p)
+        return {'games': self.games,
+                'win_rate': self.wins.mean.tolist(),
+                'win_rate_interval': list(zip(win_lower.tolist(), win_upper.tolist())),
+                'score': self.scores.mean.tolist(),
+                'score_interval': list(zip(score_lower.tolist(), score_upper.tolist())),
+                'win_rate_diff_interval': (float(diff_lower[0]), float(diff_upper[0])),
+                'score_diff_interval': (float(diff_lower[1]), float(diff_upper[1])),
+                'decided': self.decided()}
+
+    def run(self):
+        ''' Play batches until the comparison is decided or max_games are played
+
+        The results of the batches are taken in the order of the batches, so
+        the decision does not depend on which worker finishes first.
+
+        Returns:
+            (dict): see result
+        '''
+        batches = -(-self.max_games // self.batch_games)
+        # hash the whole string, create_seed keeps only its first 8 bytes
+        seeds = (seeding.hash_seed('{}-{}'.format(self.seed, batch)) for batch in range(batches))
+        with ProcessPoolExecutor(max_workers=self.num_workers) as pool:
+            def submit(seed):
+                return pool.submit(play_batch, self.agents_fn, self.batch_games, seed, self.env_config, self.duplicate)
+
+            # keep two batches per worker in flight
+            futures = deque(submit(seed) for seed in itertools.islice(seeds, 2 * self.num_workers))
+            while futures:
+                self.update(*futures.popleft().result())
+                if self.decided() or self.games >= self.max_games:
+                    for future in futures:
+                        future.cancel()
+                    break
+                for seed in itertools.islice(seeds, 1):
+                    futures.append(submit(seed))
+        return self.result()
+
+
+def _default_agents():
+    from agents.rule_agent import RuleAgent
+    from agents.random_agent import RandomAgent
+    return [RuleAgent(), RandomAgent(), RandomAgent()]
+
+
+if __name__ == '__main__':
+    print(Tournament(_default_agents, seed=0, duplicate=True).run())
@@ -0,0 +1,93 @@
+''' Columnar recording of trajectories
+
+A TrajectoryRecorder writes every transition of the games into preallocated
+arrays, one column per field:
+
+    obs       (n, 6, 4, 13) the observation of the acting player
+    action    int32, the id of the specific action, see pdktables
+    reward    float32, the transition reward, see Env.transition_reward
+    done      bool, True for the last transition of a player in a game
+    player    int8, the acting player
+    step      int32, the turn of the transition in its game
+
+See PaodekuaiEnv.run_columnar.
+'''
+from collections import namedtuple
+
+import numpy as np
+
+COLUMNS = ('obs', 'action', 'reward', 'done', 'player', 'step')
+
+TrajectoryBatch = namedtuple('TrajectoryBatch', COLUMNS)
+TrajectoryBatch.__doc__ = ''' The recorded transitions, each field is a numpy array of the column '''
+
+
+class TrajectoryRecorder(object):
+    ''' Preallocated columns of transitions, grown by doubling when full
+    '''
+
+    def __init__(self, capacity=1024, obs_shape=(6, 4, 13), obs_dtype=np.uint8):
+        ''' Initialize the columns
+
+        Args:
+            capacity (int): the transitions held before the columns grow
+            obs_shape (tuple): the shape of an observation
+            obs_dtype (numpy.dtype): the dtype of the observations
+        '''
+        self.size = 0
+        self.columns = {'obs': np.zeros((capacity,) + tuple(obs_shape), dtype=obs_dtype),
+                        'action': np.zeros(capacity, dtype=np.int32),
+                        'reward': np.zeros(capacity, dtype=np.float32),
+                        'done': np.zeros(capacity, dtype=np.bool_),
+                        'player': np.zeros(capacity, dtype=np.int8),
+                        'step': np.zeros(capacity, dtype=np.int32)}
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def capacity(self):
+        return len(self.columns['action'])
+
+    def _grow(self):
+        for name, column in self.columns.items():
+            new_column = np.zeros((2 * len(column),) + column.shape[1:], dtype=column.dtype)
+            new_column[:self.size] = column[:self.size]
+            self.columns[name] = new_column
+
+    def add(self, obs, action, player, step):
+        ''' Write the acting part of a transition, its reward and done are set later
+
+        Returns:
+            (int): the row of the transition
+        '''
+        if self.size == self.capacity:
+            self._grow()
+        row = self.size
+        columns = self.columns
+        columns['obs'][row] = obs
+        columns['action'][row] = action
+        columns['reward'][row] = 0
+        columns['done'][row] = False
+        columns['player'][row] = player
+        columns['step'][row] = step
+        self.size += 1
+        return row
+
+    def set_reward(self, row, reward, done=False):
+        ''' Set the reward and done of the transition in row
+        '''
+        self.columns['reward'][row] = reward
+        self.columns['done'][row] = done
+
+    def batch(self, start=0):
+        ''' Get the transitions from row start as a TrajectoryBatch of views, nothing is copied
+
+        The views are overwritten once the recorder is cleared, copy them to keep them.
+        '''
+        return TrajectoryBatch(*[self.columns[name][start:self.size] for name in COLUMNS])
+
+    def clear(self):
+        ''' Drop the transitions, keeping the columns
+        '''
+        self.size = 0
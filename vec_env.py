@@ -0,0 +1,110 @@
+''' Vectorized Paodekuai environment
+'''
+import numpy as np
+
+from pdkenv import PaodekuaiEnv, DEFAULT_CONFIG
+
+
+class PaodekuaiVecEnv(object):
+    ''' N Paodekuai games stepped in lockstep
+
+    The games run in 'action_ids' mode and share preallocated batch arrays:
+
+        obs           (N, 6, 4, 13) observations of the players to act
+        legal_masks   (N, num_actions) bool masks over the specific action ids
+        legal_actions list of the N int32 arrays of legal action ids
+        player_ids    (N,) the players to act
+        rewards       (N, player_num) payoffs of the games finished by the last step
+        dones         (N,) True if the game was finished by the last step
+
+    A finished game is reset at once, so obs and masks are always those of a
+    live game. The arrays are overwritten by the next step, copy them to keep them.
+    '''
+
+    def __init__(self, config=None, num_envs=None):
+        ''' Initialize the games
+
+        Args:
+            config (dict): the config of PaodekuaiEnv, 'seed' is the seed of
+                the first game, game i is seeded with seed + i
+            num_envs (int): the number of games, config['env_num'] if None
+        '''
+        _config = DEFAULT_CONFIG.copy()
+        if config is not None:
+            _config.update(config)
+        _config['action_ids'] = True
+        # the trajectories of the single games are not kept
+        _config['record_action'] = False
+        self.num_envs = _config['env_num'] if num_envs is None else num_envs
+        seed = _config['seed']
+        self.envs = []
+        for i in range(self.num_envs):
+            _config['seed'] = None if seed is None else seed + i
+            self.envs.append(PaodekuaiEnv(_config))
+
+        self.player_num = self.envs[0].player_num
+        self.action_num = self.envs[0].action_num
+        self.state_shape = self.envs[0].state_shape
+        self.obs = np.zeros([self.num_envs] + self.state_shape, dtype=_config['obs_dtype'])
+        self.legal_masks = np.zeros((self.num_envs, self.action_num), dtype=bool)
+        self.legal_actions = [np.zeros(0, dtype=np.int32) for _ in range(self.num_envs)]
+        self.player_ids = np.zeros(self.num_envs, dtype=int)
+        self.rewards = np.zeros((self.num_envs, self.player_num))
+        self.dones = np.zeros(self.num_envs, dtype=bool)
+        self.states = [None] * self.num_envs
+
+    def _set_state(self, index, state, player_id):
+        ''' Write the state of game index into the batch arrays
+        '''
+        self.states[index] = state
+        self.obs[index] = state['obs']
+        # clear only the previous legal actions instead of the whole row
+        self.legal_masks[index, self.legal_actions[index]] = False
+        self.legal_actions[index] = state['legal_actions']
+        self.legal_masks[index, state['legal_actions']] = True
+        self.player_ids[index] = player_id
+
+    def reset(self):
+        ''' Start new games in all the envs
+
+        Returns:
+            (tuple): Tuple containing:
+
+                (numpy.array): the observations, (N, 6, 4, 13)
+                (numpy.array): the legal action masks, (N, num_actions)
+                (numpy.array): the players to act, (N,)
+        '''
+        for index, env in enumerate(self.envs):
+            state, player_id = env.reset()
+            self._set_state(index, state, player_id)
+        self.rewards[:] = 0
+        self.dones[:] = False
+        return self.obs, self.legal_masks, self.player_ids
+
+    def step(self, actions):
+        ''' Step all the games with one action each
+
+        Args:
+            actions (list): N action ids, or raw actions, of the players to act
+
+        Returns:
+            (tuple): Tuple containing:
+
+                (numpy.array): the observations, (N, 6, 4, 13)
+                (numpy.array): the legal action masks, (N, num_actions)
+                (numpy.array): the payoffs of the finished games, (N, player_num)
+                (numpy.array): True for the games finished by this step, (N,)
+                (numpy.array): the players to act, (N,)
+        '''
+        if len(actions) != self.num_envs:
+            raise ValueError('Expected {} actions, got {}'.format(self.num_envs, len(actions)))
+        self.rewards[:] = 0
+        for index, (env, action) in enumerate(zip(self.envs, actions)):
+            state, player_id = env.step(action)
+            done = env.is_over()
+            self.dones[index] = done
+            if done:
+                self.rewards[index] = env.get_payoffs()
+                state, player_id = env.reset()
+            self._set_state(index, state, player_id)
+        return self.obs, self.legal_masks, self.rewards, self.dones, self.player_ids